@@ -1,13 +1,29 @@
-import os
-import pickle
-from typing import Optional
-from pydantic import BaseModel
-
-import wandb
-import pandas as pd
-from fastapi import FastAPI
+import asyncio
+import hmac
+import logging
+import threading
+import time
+from functools import partial
+from typing import List, Optional
+from pydantic import BaseModel, conint
+
+import numpy as np
+from fastapi import FastAPI, Header, HTTPException, Query, Request
+from fastapi.responses import PlainTextResponse
+from starlette.concurrency import run_in_threadpool
 from starlette.middleware.cors import CORSMiddleware
 
+from serving import settings
+from serving.batching import MicroBatcher
+from serving.cache import PredictionCache, input_key
+from serving.capture import RequestCapture
+from serving.drift import DriftMonitor, load_reference
+from serving.encoders import FEATURES
+from serving.metrics import MetricsMiddleware, metrics, stats_collector
+from serving.registry import ModelRegistry, load_bundle, touch
+from serving.shadow import ShadowEvaluator
+from serving.streaming import BodyStreamingResponse, score_ndjson
+
 
 class Input(BaseModel):
     year: int
@@ -26,6 +42,20 @@ class Input(BaseModel):
     car_type: str
 
 
+class Sweep(BaseModel):
+    input: Input
+    feature: str
+    values: Optional[List[float]] = None
+    start: Optional[float] = None
+    stop: Optional[float] = None
+    # bounded here, before np.linspace allocates the points
+    num: conint(ge=1, le=settings.SWEEP_MAX_POINTS) = 50
+
+
+# numeric features a sweep can vary, and whether Input coerces them to int
+SWEEP_FEATURES = {'year': True, 'km_driven': True, 'num_seats': True, 'engine_capacity': False}
+
+
 api = FastAPI(title="MLOps", version='0.1.0')
 origins = ["*"]
 api.add_middleware(
@@ -37,48 +67,376 @@ api.add_middleware(
     max_age=600,
 )
 
-run = wandb.init(project='mlops', job_type='serving')
-artifact = run.use_artifact('phamvanhanh6720/mlops/model:product', type='Model')
-artifact_dir = artifact.download()
-run.finish()
+logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+
+# loaded at import, so that a pre-forking server (see gunicorn.conf.py) loads it once for all workers
+registry = ModelRegistry(partial(load_bundle, settings.MODEL_ARTIFACT, settings.ARTIFACT_CACHE_DIR,
+                                 stores_dir='stores', offline=settings.OFFLINE, mmap=settings.FOREST_MMAP))
+registry.load()
+
+# candidate model scoring a sample of the served traffic; a candidate that fails to load only disables shadowing
+shadow = None
+if settings.SHADOW_ARTIFACT:
+    shadow_registry = ModelRegistry(partial(load_bundle, settings.SHADOW_ARTIFACT, settings.ARTIFACT_CACHE_DIR,
+                                            stores_dir='stores', offline=settings.OFFLINE, mmap=settings.FOREST_MMAP))
+    try:
+        shadow_registry.load()
+    except Exception:
+        logging.getLogger(__name__).exception('Could not load shadow model %s, shadowing is disabled',
+                                              settings.SHADOW_ARTIFACT)
+    else:
+        shadow = ShadowEvaluator(shadow_registry, fraction=settings.SHADOW_FRACTION, workers=settings.SHADOW_WORKERS,
+                                 queue_size=settings.SHADOW_QUEUE_SIZE)
+
+
+def predict_current(inputs: List[Input]) -> list:
+    """
+    Score inputs with the bundle being served right now, pairing each price with its model version
+    """
+    bundle = registry.current
+    return [(price, bundle.version) for price in bundle.predict(inputs)]
+
+
+batcher = None
+if settings.BATCHING:
+    batcher = MicroBatcher(predict_current, max_batch_size=settings.BATCH_MAX_SIZE,
+                           max_wait=settings.BATCH_MAX_WAIT_MS / 1000)
+
+cache = None
+if settings.CACHE_SIZE > 0:
+    cache = PredictionCache(max_size=settings.CACHE_SIZE, ttl=settings.CACHE_TTL)
+
+capture = None
+if settings.CAPTURE:
+    capture = RequestCapture(settings.CAPTURE_DIR, sample_rate=settings.CAPTURE_SAMPLE_RATE,
+                             buffer_size=settings.CAPTURE_BUFFER_SIZE, shard_rows=settings.CAPTURE_SHARD_ROWS,
+                             shard_seconds=settings.CAPTURE_SHARD_SECONDS, max_shards=settings.CAPTURE_MAX_SHARDS,
+                             compression=settings.CAPTURE_COMPRESSION)
+
+if batcher is not None:
+    metrics.add_collector(stats_collector('mlops_batcher', batcher.stats, counters=('batches', 'items')))
+if cache is not None:
+    metrics.add_collector(stats_collector('mlops_cache', cache.stats,
+                                          counters=('hits', 'misses', 'evictions', 'expirations', 'invalidations')))
+if shadow is not None:
+    metrics.add_collector(stats_collector('mlops_shadow', shadow.stats,
+                                          counters=('submitted', 'dropped', 'scored', 'errors')))
+if capture is not None:
+    metrics.add_collector(stats_collector('mlops_capture', capture.stats,
+                                          counters=('written', 'dropped', 'shards', 'errors')))
+# drift statistics are kept for the reference of the served bundle and start over when a reload changes it
+drift = None
+drift_lock = threading.Lock()
+drift_reference = load_reference(settings.DRIFT_REFERENCE) if settings.DRIFT and settings.DRIFT_REFERENCE else None
+
+
+def drift_monitor() -> Optional[DriftMonitor]:
+    global drift
+    if not settings.DRIFT:
+        return None
+    reference = registry.current.reference or drift_reference
+    if reference is None:
+        return None
+    monitor = drift
+    if monitor is None or monitor.reference is not reference:
+        with drift_lock:
+            if drift is None or drift.reference is not reference:
+                drift = DriftMonitor(reference, max_unseen=settings.DRIFT_MAX_UNSEEN)
+            monitor = drift
+    return monitor
+
+
+def record_served(inputs: List[Input], prices, version: str) -> None:
+    """
+    Hand served predictions to the request capture, the drift sketches and the shadow model
+    """
+    if capture is not None:
+        capture.record_many(inputs, prices, version)
+    if shadow is not None:
+        shadow.submit(inputs, prices, version)
+    monitor = drift_monitor()
+    if monitor is not None:
+        monitor.observe_many(inputs)
+
+
+def drift_collector():
+    monitor = drift_monitor()
+    if monitor is None:
+        return []
+    features = monitor.report(settings.DRIFT_THRESHOLD, top=0)['features']
+    return [('mlops_drift_psi', 'population stability index of served inputs against the training data', 'gauge',
+             {(('feature', feature),): stats['psi'] for feature, stats in features.items()
+              if stats['psi'] is not None})]
 
-with open(os.path.join(artifact_dir, 'model.pkl'), 'rb') as file:
-    model = pickle.load(file)
 
-with open(os.path.join('stores', 'branch.pkl'), 'rb') as file:
-    transform_branch = pickle.load(file)
+metrics.add_collector(drift_collector)
+metrics.add_collector(lambda: [('mlops_model_info', 'served model version', 'gauge',
+                                {(('version', registry.current.version),): 1})])
 
-with open(os.path.join('stores', 'model.pkl'), 'rb') as file:
-    transform_model = pickle.load(file)
 
-with open(os.path.join('stores', 'others.pkl'), 'rb') as file:
-    transform_other = pickle.load(file)
+@api.on_event('startup')
+def start_background_tasks():
+    # threads do not survive a fork, so every worker starts its own here
+    if batcher is not None:
+        batcher.start()
+    if settings.RELOAD_WATCH_FILE:
+        registry.watch(settings.RELOAD_WATCH_FILE, interval=settings.RELOAD_WATCH_INTERVAL)
+        if shadow is not None:
+            shadow.registry.watch(shadow_watch_file(), interval=settings.RELOAD_WATCH_INTERVAL)
+    if capture is not None:
+        capture.start()
+    if shadow is not None:
+        shadow.start()
 
-category_other = ['external_color', 'internal_color', 'origin', 'gearbox', 'wheel_drive', 'car_type']
-numeric_features = ['year','km_driven','num_seats','engine_capacity']
-category_features = ['branch','model','origin','external_color','internal_color','gearbox','wheel_drive','car_type']
-FEATURES = numeric_features + category_features
+
+@api.on_event('shutdown')
+def stop_background_tasks():
+    if capture is not None:
+        capture.stop()
+    if shadow is not None:
+        shadow.stop()
+
+
+def observe_parse(request: Request) -> None:
+    """
+    Time from the request arriving to the handler running: body read and pydantic validation
+    """
+    start = request.scope.get('mlops.start')
+    if start is not None:
+        metrics.observe_stage('parse', time.perf_counter() - start)
+
+
+def check_quantiles(quantiles: Optional[List[float]], bundle) -> None:
+    if quantiles and not all(0 <= q <= 1 for q in quantiles):
+        raise HTTPException(status_code=422, detail='quantiles must be between 0 and 1')
+    if quantiles and not bundle.has_intervals:
+        raise HTTPException(status_code=422, detail='quantiles need a random forest model, not {}'.format(bundle.kind))
+
+
+def interval(std: float, values, quantiles: List[float]) -> dict:
+    return {'std': std, 'quantiles': {str(q): value for q, value in zip(quantiles, values.tolist())}}
 
 
 @api.post('/api/predict')
-def predict(input: Input):
-    value = [input.year, input.location, input.branch, input.model,
-             input.origin, input.km_driven, input.external_color, input.internal_color,
-             input.num_seats, input.fuels, input.engine_capacity, input.gearbox,
-             input.wheel_drive, input.car_type]
+async def predict(input: Input, request: Request, quantiles: Optional[List[float]] = Query(None)):
+    observe_parse(request)
+    if quantiles:
+        # uncertainty bands come from the per-tree outputs, so they skip the cache and the batcher
+        bundle = registry.current
+        check_quantiles(quantiles, bundle)
+        prices, std, values = await run_in_threadpool(bundle.predict_interval, [input], quantiles)
+        record_served([input], prices[:1], bundle.version)
+        return dict({'price': prices[0], 'version': bundle.version}, **interval(std[0], values[0], quantiles))
+
+    if cache is not None:
+        key = input_key(input)
+        version = registry.current.version
+        with metrics.stage('cache'):
+            price = cache.get(key, version)
+        if price is not None:
+            record_served([input], [price], version)
+            return {'price': price, 'version': version}
+
+    if batcher is not None:
+        price, version = await asyncio.wrap_future(batcher.submit(input))
+    else:
+        price, version = (await run_in_threadpool(predict_current, [input]))[0]
+
+    if cache is not None:
+        cache.put(key, version, price)
+    record_served([input], [price], version)
+
+    return {'price': price, 'version': version}
+
+
+@api.post('/api/predict/batch')
+def predict_batch(inputs: List[Input], request: Request, quantiles: Optional[List[float]] = Query(None)):
+    observe_parse(request)
+    bundle = registry.current
+    check_quantiles(quantiles, bundle)
+    if not inputs:
+        return {'prices': [], 'version': bundle.version}
+
+    if quantiles:
+        prices, std, values = bundle.predict_interval(inputs, quantiles)
+        record_served(inputs, prices.tolist(), bundle.version)
+        return {'prices': prices.tolist(), 'version': bundle.version,
+                'intervals': [interval(s, v, quantiles) for s, v in zip(std.tolist(), values)]}
+
+    prices = bundle.predict(inputs).tolist()
+    record_served(inputs, prices, bundle.version)
+
+    return {'prices': prices, 'version': bundle.version}
+
+
+@api.get('/api/health')
+def health():
+    """
+    Readiness probe: the worker is up and serving a model
+    """
+    return {'status': 'ok', 'version': registry.current.version}
+
+
+@api.get('/api/batcher')
+def batcher_stats():
+    if batcher is None:
+        raise HTTPException(status_code=404, detail='Micro-batching is disabled')
+
+    return batcher.stats()
+
+
+@api.get('/api/cache')
+def cache_stats():
+    if cache is None:
+        raise HTTPException(status_code=404, detail='Prediction cache is disabled')
+
+    return cache.stats()
+
+
+@api.get('/api/capture')
+def capture_stats():
+    if capture is None:
+        raise HTTPException(status_code=404, detail='Request capture is disabled')
+
+    return capture.stats()
+
+
+@api.get('/api/shadow')
+def shadow_report(pairs: int = 0):
+    """
+    Divergence between the served model and the shadow candidate on the mirrored traffic of this worker
+    """
+    if shadow is None:
+        raise HTTPException(status_code=404, detail='Shadow evaluation is disabled')
+
+    return dict(shadow.report(pairs=pairs), primary_version=registry.current.version)
+
+
+@api.get('/api/drift')
+def drift_report(top: int = 10):
+    """
+    Per-feature comparison of the inputs served by this worker against the training data
+    """
+    monitor = drift_monitor()
+    if monitor is None:
+        raise HTTPException(status_code=404, detail='Drift monitoring is disabled or the model has no reference statistics')
+
+    return dict(monitor.report(settings.DRIFT_THRESHOLD, top=top), version=registry.current.version)
+
+
+@api.post('/api/predict/sweep')
+def predict_sweep(sweep: Sweep):
+    """
+    Price curve of one car while a single numeric feature runs over `values`, or `num` points from `start` to `stop`
+    """
+    if sweep.feature not in SWEEP_FEATURES:
+        raise HTTPException(status_code=422, detail='feature must be one of {}'.format(sorted(SWEEP_FEATURES)))
+    if sweep.values is not None:
+        values = np.array(sweep.values, dtype=np.float64)
+    elif sweep.start is not None and sweep.stop is not None:
+        values = np.linspace(sweep.start, sweep.stop, sweep.num)
+    else:
+        raise HTTPException(status_code=422, detail='give either values or start and stop')
+    if not 0 < len(values) <= settings.SWEEP_MAX_POINTS:
+        raise HTTPException(status_code=422,
+                            detail='a sweep has between 1 and {} points'.format(settings.SWEEP_MAX_POINTS))
+    if SWEEP_FEATURES[sweep.feature]:
+        values = np.round(values)
+
+    bundle = registry.current
+    prices = bundle.sweep(sweep.input, sweep.feature, values)
+
+    return {'feature': sweep.feature, 'values': values.tolist(), 'prices': prices.tolist(), 'version': bundle.version}
+
+
+def explanation(bias: float, contributions, version: str) -> dict:
+    return {'price': bias + contributions.sum(), 'bias': bias,
+            'contributions': dict(zip(FEATURES, contributions.tolist())), 'version': version}
+
+
+@api.post('/api/explain')
+def explain(input: Input):
+    """
+    Price of one car split into the training mean plus one contribution per feature
+    """
+    bundle = registry.current
+    bias, contributions = bundle.explain([input])
+
+    return explanation(float(bias[0]), contributions[0], bundle.version)
+
+
+@api.post('/api/explain/batch')
+def explain_batch(inputs: List[Input]):
+    bundle = registry.current
+    if not inputs:
+        return {'explanations': [], 'version': bundle.version}
+
+    bias, contributions = bundle.explain(inputs)
+
+    return {'explanations': [explanation(float(b), c, bundle.version) for b, c in zip(bias, contributions)],
+            'version': bundle.version}
+
+
+async def score_chunk(inputs: List[Input]):
+    bundle = registry.current
+    prices = await run_in_threadpool(bundle.predict, inputs)
+    record_served(inputs, prices.tolist(), bundle.version)
+    return prices, bundle.version
+
+
+@api.post('/api/predict/stream')
+async def predict_stream(request: Request):
+    """
+    Score an NDJSON body of Input records, streaming one NDJSON result line per input line
+    """
+    results = score_ndjson(request.stream(), parse=Input.parse_raw, score=score_chunk,
+                           chunk_size=settings.STREAM_CHUNK_SIZE, max_line_bytes=settings.STREAM_MAX_LINE_BYTES)
+
+    return BodyStreamingResponse(results, media_type='application/x-ndjson')
+
+
+def check_admin(token: Optional[str]) -> None:
+    # fail closed: without a configured token the admin endpoints do not exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail='Admin endpoints are disabled, set ADMIN_TOKEN to enable them')
+    if not hmac.compare_digest((token or '').encode(), settings.ADMIN_TOKEN.encode()):
+        raise HTTPException(status_code=403, detail='Invalid admin token')
+
+
+def shadow_watch_file() -> str:
+    return settings.RELOAD_WATCH_FILE + '.shadow'
+
+
+@api.post('/api/admin/reload')
+def reload_model(x_admin_token: Optional[str] = Header(None), reload_shadow: bool = Query(False, alias='shadow')):
+    check_admin(x_admin_token)
+    target = registry
+    if reload_shadow:
+        if shadow is None:
+            raise HTTPException(status_code=404, detail='Shadow evaluation is disabled')
+        target = shadow.registry
+    if settings.RELOAD_WATCH_FILE:
+        # every worker watches the file, while this request only reaches one of them
+        touch(shadow_watch_file() if reload_shadow else settings.RELOAD_WATCH_FILE)
+        return {'reloading': True, 'started': True, 'broadcast': True, 'version': target.current.version}
+    started = target.reload()
+
+    return {'reloading': True, 'started': started, 'broadcast': False, 'version': target.current.version}
+
+
+@api.get('/api/admin/model')
+def model_status(x_admin_token: Optional[str] = Header(None)):
+    check_admin(x_admin_token)
 
-    column = ['year', 'location', 'branch', 'model', 'origin', 'km_driven',
-              'external_color', 'internal_color', 'num_seats', 'fuels', 'engine_capacity',
-              'gearbox', 'wheel_drive', 'car_type']
+    return registry.status()
 
-    df = pd.DataFrame(data=[value], columns=column)
 
-    df['branch'] = transform_branch.transform(df['branch'])
-    df['model'] = transform_model.transform(df['model'])
-    df[category_other] = transform_other.transform(df[category_other])
-    df = df[FEATURES]
+@api.get('/metrics', response_class=PlainTextResponse)
+def prometheus_metrics():
+    if not metrics.enabled:
+        raise HTTPException(status_code=404, detail='Metrics are disabled')
 
-    price = model.predict(df)[0]
+    return PlainTextResponse(metrics.render(), media_type='text/plain; version=0.0.4')
 
-    return {'price': price}
 
+api.add_middleware(MetricsMiddleware, metrics=metrics, paths=[route.path for route in api.routes])
@@ -1,5 +1,6 @@
 import requests
 import json
+import pandas as pd
 import streamlit as st
 
 st.title("The price of used cars App")
@@ -66,4 +67,11 @@ if is_predict:
     results = content['price']
 
     st.text("Price: {:.2f} M VND".format(results))
+
+    # price against mileage for the same car, from a single sweep call
+    sweep_api = 'http://localhost:8080/api/predict/sweep'
+    sweep = {'input': data, 'feature': 'km_driven', 'start': 0, 'stop': 200000, 'num': 41}
+    response = requests.post(url=sweep_api, data=json.dumps(sweep))
+    curve = json.loads(response.content)
+    st.line_chart(pd.DataFrame({'Price (M VND)': curve['prices']}, index=pd.Index(curve['values'], name='Km Driven')))
     st.image('./stores/sample.jpeg')
\ No newline at end of file
@@ -0,0 +1,178 @@
+"""
+Offline bulk scoring of CSV or Parquet files with the served model bundle.
+
+    python batch_score.py listings.parquet prices.parquet --workers 8 --offline
+
+The bundle is loaded exactly like the API does (artifact cache, memory-mapped forest,
+compiled encoders). The input is read in chunks, chunks are scored on a process pool
+and the output is written in input order with `price` and `error` columns appended. Rows with a
+missing feature get an error instead of a price.
+"""
+import argparse
+import logging
+import multiprocessing
+import time
+from collections import deque
+
+import numpy as np
+import pandas as pd
+
+from serving import settings
+from serving.encoders import FEATURES, numeric_features
+from serving.registry import load_bundle
+
+
+logger = logging.getLogger('batch_score')
+
+# CSV column types, as Input declares them; columns that are not features are read as strings.
+# Fixed types keep every chunk, and so the Parquet output, on one schema.
+INTEGER_FEATURES = ('year', 'km_driven', 'num_seats')
+
+_bundle = None
+
+
+def _init_worker(loader_kwargs: dict) -> None:
+    # forked workers inherit the bundle loaded by the parent, others load their own
+    global _bundle
+    if _bundle is None:
+        _bundle = load_bundle(**loader_kwargs)
+
+
+def score_frame(df: pd.DataFrame):
+    """
+    (prices, errors) of the rows of `df`. A row with a missing feature, which the API would reject,
+    gets no price and a `missing ...` error instead: NaN would silently follow the right branch of
+    every split.
+    """
+    missing = df[FEATURES].isna().to_numpy()
+    invalid = missing.any(axis=1)
+    prices = np.full(len(df), np.nan)
+    if not invalid.all():
+        prices[~invalid] = _bundle.forest.predict(_bundle.encoders.encode_frame(df[~invalid]))
+    errors = [None] * len(df)
+    for i in np.flatnonzero(invalid):
+        errors[i] = 'missing {}'.format(', '.join(np.array(FEATURES)[missing[i]]))
+    return prices, errors
+
+
+def file_format(path: str) -> str:
+    return 'parquet' if path.endswith(('.parquet', '.pq')) else 'csv'
+
+
+def read_chunks(path: str, chunksize: int):
+    if file_format(path) == 'parquet':
+        import pyarrow.parquet as pq
+        for batch in pq.ParquetFile(path).iter_batches(batch_size=chunksize):
+            yield batch.to_pandas()
+    else:
+        yield from pd.read_csv(path, chunksize=chunksize, dtype=csv_dtypes(path))
+
+
+def csv_dtypes(path: str) -> dict:
+    dtypes = {column: str for column in pd.read_csv(path, nrows=0).columns}
+    for feature in numeric_features:
+        dtypes[feature] = 'Int64' if feature in INTEGER_FEATURES else 'float64'
+    return dtypes
+
+
+def output_schema(input_path: str):
+    """
+    Arrow schema of the output: the input columns with `price` and `error` appended
+    """
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    if file_format(input_path) == 'parquet':
+        schema = pq.ParquetFile(input_path).schema_arrow
+    else:
+        types = {'Int64': pa.int64(), 'float64': pa.float64(), str: pa.string()}
+        schema = pa.schema([(column, types[dtype]) for column, dtype in csv_dtypes(input_path).items()])
+    return schema.append(pa.field('price', pa.float64())).append(pa.field('error', pa.string()))
+
+
+class ChunkWriter:
+    def __init__(self, path: str, schema=None) -> None:
+        """
+        `schema` is the Arrow schema every chunk is cast to in a Parquet file
+        """
+        self.path = path
+        self.format = file_format(path)
+        self.schema = schema
+        self.parquet = None
+        self.header = True
+
+    def write(self, df: pd.DataFrame) -> None:
+        if self.format == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            # a schema inferred per chunk would change with, say, a column that is all null in one chunk
+            table = pa.Table.from_pandas(df, schema=self.schema, preserve_index=False)
+            if self.parquet is None:
+                self.parquet = pq.ParquetWriter(self.path, table.schema)
+            self.parquet.write_table(table)
+        else:
+            df.to_csv(self.path, mode='w' if self.header else 'a', header=self.header, index=False)
+            self.header = False
+
+    def close(self) -> None:
+        if self.parquet is not None:
+            self.parquet.close()
+
+
+def score_file(input_path: str, output_path: str, loader_kwargs: dict, workers: int, chunksize: int) -> int:
+    global _bundle
+    _bundle = load_bundle(**loader_kwargs)
+    logger.info('Scoring %s with model %s on %d workers', input_path, _bundle.version, workers)
+
+    writer = ChunkWriter(output_path, output_schema(input_path) if file_format(output_path) == 'parquet' else None)
+    pending = deque()
+    rows, start = 0, time.perf_counter()
+
+    def flush_oldest():
+        nonlocal rows
+        chunk, result = pending.popleft()
+        chunk['price'], chunk['error'] = result.get()
+        writer.write(chunk)
+        rows += len(chunk)
+        elapsed = time.perf_counter() - start
+        logger.info('%d rows scored, %.0f rows/s', rows, rows / elapsed)
+
+    try:
+        # multiprocessing.Pool: ProcessPoolExecutor only takes an initializer from Python 3.7
+        with multiprocessing.Pool(workers, initializer=_init_worker, initargs=(loader_kwargs,)) as pool:
+            for chunk in read_chunks(input_path, chunksize):
+                # keep at most two chunks per worker in flight so memory stays bounded
+                if len(pending) >= 2 * workers:
+                    flush_oldest()
+                pending.append((chunk, pool.apply_async(score_frame, (chunk[FEATURES],))))
+            while pending:
+                flush_oldest()
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    logger.info('Done: %d rows in %.1f s (%.0f rows/s)', rows, elapsed, rows / elapsed if elapsed else 0)
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('input', help='CSV or Parquet file of raw listings')
+    parser.add_argument('output', help='CSV or Parquet file to write, by extension')
+    parser.add_argument('--workers', type=int, default=multiprocessing.cpu_count())
+    parser.add_argument('--chunksize', type=int, default=50000)
+    parser.add_argument('--artifact', default=settings.MODEL_ARTIFACT)
+    parser.add_argument('--cache-dir', default=settings.ARTIFACT_CACHE_DIR)
+    parser.add_argument('--stores', default='stores')
+    parser.add_argument('--offline', action='store_true', default=settings.OFFLINE,
+                        help='use the locally cached artifact without contacting wandb')
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s %(name)s: %(message)s')
+    loader_kwargs = {'artifact_name': args.artifact, 'cache_dir': args.cache_dir, 'stores_dir': args.stores,
+                     'offline': args.offline}
+    score_file(args.input, args.output, loader_kwargs, max(1, args.workers), args.chunksize)
+
+
+if __name__ == '__main__':
+    main()
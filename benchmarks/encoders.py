@@ -0,0 +1,85 @@
+"""
+Parity check and per-request timing of the compiled lookup-table encoders
+against the pickled category_encoders objects in stores/.
+
+    python benchmarks/encoders.py --repeat 2000
+"""
+import argparse
+import os
+import pickle
+import sys
+import timeit
+from types import SimpleNamespace
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serving.encoders import CompiledEncoders, FEATURES, ordinal_tables  # noqa: E402
+
+category_other = ['external_color', 'internal_color', 'origin', 'gearbox', 'wheel_drive', 'car_type']
+
+
+def load_encoders(stores):
+    encoders = []
+    for name in ['branch.pkl', 'model.pkl', 'others.pkl']:
+        with open(os.path.join(stores, name), 'rb') as file:
+            encoders.append(pickle.load(file))
+    return encoders
+
+
+def reference_encode(inputs, transform_branch, transform_model, transform_other):
+    """
+    The pandas path api.predict used before the lookup tables were compiled
+    """
+    df = pd.DataFrame([vars(item) for item in inputs])
+    df['branch'] = transform_branch.transform(df['branch'])
+    df['model'] = transform_model.transform(df['model'])
+    df[category_other] = transform_other.transform(df[category_other])
+    return df[FEATURES].to_numpy(dtype=np.float64)
+
+
+def sample_inputs(transform_branch, transform_model, transform_other, n, seed=0):
+    rng = np.random.RandomState(seed)
+    categories = {}
+    categories.update(ordinal_tables(transform_branch.ordinal_encoder))
+    categories.update(ordinal_tables(transform_model.ordinal_encoder))
+    categories.update(ordinal_tables(transform_other))
+    # every column also sees a value the encoders were never fitted on
+    choices = {col: list(table) + ['__unseen__'] for col, table in categories.items()}
+
+    inputs = []
+    for _ in range(n):
+        record = {col: values[rng.randint(len(values))] for col, values in choices.items()}
+        record.update(year=int(rng.randint(2007, 2023)), km_driven=int(rng.randint(0, 200000)),
+                      num_seats=int(rng.choice([4, 5, 7, 16])), engine_capacity=float(rng.choice([1.0, 1.5, 2.4])),
+                      location='', fuels='gasoline')
+        inputs.append(SimpleNamespace(**record))
+    return inputs
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--stores', default='stores')
+    parser.add_argument('--rows', type=int, default=5000)
+    parser.add_argument('--repeat', type=int, default=1000)
+    args = parser.parse_args()
+
+    fitted = load_encoders(args.stores)
+    compiled = CompiledEncoders.from_encoders(*fitted)
+    inputs = sample_inputs(*fitted, n=args.rows)
+
+    expected = reference_encode(inputs, *fitted)
+    actual = compiled.encode(inputs)
+    np.testing.assert_allclose(actual, expected, rtol=0, atol=0, equal_nan=True)
+    print('parity: {} rows identical'.format(len(inputs)))
+
+    one = inputs[:1]
+    reference = timeit.timeit(lambda: reference_encode(one, *fitted), number=args.repeat) / args.repeat
+    lookup = timeit.timeit(lambda: compiled.encode(one), number=args.repeat) / args.repeat
+    print('per-request encode: pandas {:.1f} us, compiled {:.1f} us ({:.0f}x)'.format(
+        reference * 1e6, lookup * 1e6, reference / lookup))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,127 @@
+"""
+Head-to-head of the training engines: training time, model size on disk, single-row latency and test quality.
+
+Each engine is fitted through make_engine() as train() does: the random forest with its
+hyperparameter search (or the fixed --rf-params), the gradient boosting model with early stopping
+on a validation split of the training rows. Size on disk is the pickled sklearn model, and the
+FlatForest arrays a serving bundle holds. Latency is one row at a time, through FlatForest as served
+and through the sklearn model.
+
+    python benchmarks/engines.py --data transformed-train.csv --test transformed-test.csv
+"""
+import argparse
+import json
+import os
+import pickle
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from components.training.engines import ENGINES, make_engine  # noqa: E402
+from serving.forest import FlatForest  # noqa: E402
+
+
+def directory_bytes(directory: str) -> int:
+    return sum(os.path.getsize(os.path.join(directory, name)) for name in os.listdir(directory))
+
+
+def single_row_latency(predict, X, repeat: int) -> dict:
+    """
+    Median and p99 milliseconds of `predict` on one row, cycling through the rows of X
+    """
+    times = []
+    for i in range(repeat):
+        row = X[i % len(X):i % len(X) + 1]
+        started = time.perf_counter()
+        predict(row)
+        times.append(time.perf_counter() - started)
+    return {'p50_ms': float(np.percentile(times, 50) * 1000), 'p99_ms': float(np.percentile(times, 99) * 1000)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', required=True, help='transformed training CSV with a price column')
+    parser.add_argument('--test', default=None, help='transformed test CSV; a split of --data when omitted')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--val-size', type=float, default=0.15, help='validation split of the training rows')
+    parser.add_argument('--engines', default=','.join(ENGINES))
+    parser.add_argument('--rf-params', default=None, help='fit this random forest configuration (JSON) instead '
+                                                          'of searching')
+    parser.add_argument('--repeat', type=int, default=2000, help='single-row predictions per latency measurement')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    from sklearn.metrics import mean_absolute_error, r2_score
+    from sklearn.model_selection import train_test_split
+
+    train = pd.read_csv(args.data)
+    if args.test:
+        test = pd.read_csv(args.test)
+    else:
+        train, test = train_test_split(train, test_size=args.test_size, random_state=0)
+    train, val = train_test_split(train, test_size=args.val_size, random_state=0)
+
+    def split(frame):
+        return frame.drop(['price'], axis=1).to_numpy(dtype=np.float64), frame['price'].to_numpy(dtype=np.float64)
+
+    (X_train, y_train), (X_val, y_val), (X_test, y_test) = split(train), split(val), split(test)
+    print('{} training rows, {} validation rows, {} test rows'.format(len(X_train), len(X_val), len(X_test)))
+
+    results = []
+    for kind in args.engines.split(','):
+        options = {}
+        if kind == 'random_forest':
+            options = {'n_jobs': args.n_jobs, 'verbose': 0,
+                       'params': json.loads(args.rf_params) if args.rf_params else None}
+        engine = make_engine(kind, **options)
+        started = time.perf_counter()
+        engine.fit(X_train, y_train, X_val, y_val)
+        train_s = time.perf_counter() - started
+
+        model = engine.model
+        if hasattr(model, 'n_jobs'):
+            # single-row latency as served: one thread
+            model.set_params(n_jobs=1)
+        forest = FlatForest.from_estimator(model)
+        forest.prepare_explanations()
+        directory = tempfile.mkdtemp(prefix='mlops-engine-')
+        try:
+            forest.save_arrays(directory)
+            bundle_bytes = directory_bytes(directory)
+        finally:
+            shutil.rmtree(directory, ignore_errors=True)
+
+        y_preds = forest.predict(X_test)
+        results.append({
+            'engine': kind,
+            'train_s': train_s,
+            'trees': forest.n_trees,
+            'nodes': forest.n_nodes,
+            'pickle_mb': len(pickle.dumps(model)) / 2 ** 20,
+            'bundle_mb': bundle_bytes / 2 ** 20,
+            'flat_latency': single_row_latency(forest.predict, X_test, args.repeat),
+            'sklearn_latency': single_row_latency(model.predict, X_test, args.repeat),
+            'test_mae': mean_absolute_error(y_test, y_preds),
+            'test_r2': r2_score(y_test, y_preds),
+            'params': engine.params,
+        })
+        print('{engine:<18} train {train_s:7.1f} s   {trees:4d} trees {nodes:7d} nodes   pickle {pickle_mb:6.2f} MB   '
+              'bundle {bundle_mb:6.2f} MB   test MAE {test_mae:8.3f}   R2 {test_r2:.4f}'.format(**results[-1]))
+        print('{:<18} single row p50/p99: flat {:.3f}/{:.3f} ms, sklearn {:.3f}/{:.3f} ms'.format(
+            '', results[-1]['flat_latency']['p50_ms'], results[-1]['flat_latency']['p99_ms'],
+            results[-1]['sklearn_latency']['p50_ms'], results[-1]['sklearn_latency']['p99_ms']))
+        print('{:<18} {}'.format('', engine.params))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
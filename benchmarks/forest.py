@@ -0,0 +1,89 @@
+"""
+Parity, latency and throughput of the flattened forest engine against sklearn's predict,
+and the cost of per-feature explanations and of 5/50/95% prediction intervals next to a
+plain predict.
+
+    python benchmarks/forest.py --model model.pkl --data transformed-test.csv
+"""
+import argparse
+import os
+import pickle
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from serving.encoders import FEATURES  # noqa: E402
+from serving.forest import FlatForest  # noqa: E402
+
+
+def load_rows(path, forest, n_rows, seed=0):
+    """
+    Feature rows from a transformed CSV, or uniform samples over the split thresholds
+    """
+    if path:
+        return pd.read_csv(path)[FEATURES].to_numpy(dtype=np.float64)
+
+    rng = np.random.RandomState(seed)
+    X = np.empty((n_rows, len(FEATURES)))
+    inner = np.isfinite(forest.threshold)
+    for column in range(len(FEATURES)):
+        thresholds = forest.threshold[inner & (forest.feature == column)]
+        low, high = (thresholds.min(), thresholds.max()) if len(thresholds) else (0.0, 1.0)
+        X[:, column] = rng.uniform(low - 1, high + 1, n_rows)
+    return X
+
+
+def timed(func, X, min_time=1.0):
+    calls, start = 0, time.perf_counter()
+    while True:
+        func(X)
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--model', default='model.pkl')
+    parser.add_argument('--data', default=None, help='CSV with the FEATURES columns')
+    parser.add_argument('--rows', type=int, default=10000)
+    parser.add_argument('--batch-sizes', default='1,10,100,1000')
+    args = parser.parse_args()
+
+    with open(args.model, 'rb') as file:
+        model = pickle.load(file)
+    forest = FlatForest.from_estimator(model)
+    X = load_rows(args.data, forest, args.rows)
+    print('{} trees, {} nodes, max depth {}'.format(forest.n_trees, forest.n_nodes, forest.max_depth))
+
+    error = np.abs(forest.predict(X) - model.predict(X)).max()
+    print('parity: max abs difference {:.3g} over {} rows'.format(error, len(X)))
+    assert np.allclose(forest.predict(X), model.predict(X), rtol=1e-9, atol=1e-6)
+
+    forest.prepare_explanations()
+    bias, contributions = forest.explain(X)
+    assert np.allclose(bias + contributions.sum(axis=1), forest.predict(X), rtol=1e-9, atol=1e-6)
+    per_tree = np.stack([tree.predict(X.astype(np.float32)) for tree in model.estimators_[:5]], axis=1)
+    assert np.allclose(forest.predict_trees(X)[:, :5], per_tree)
+
+    def interval(rows):
+        trees = forest.predict_trees(rows)
+        return trees.mean(axis=1), trees.std(axis=1), np.quantile(trees, [0.05, 0.5, 0.95], axis=1)
+
+    print('{:>6} {:>12} {:>12} {:>15} {:>15} {:>12} {:>12}'.format(
+        'batch', 'sklearn ms', 'flat ms', 'sklearn rows/s', 'flat rows/s', 'explain ms', 'interval ms'))
+    for batch in [int(size) for size in args.batch_sizes.split(',')]:
+        rows = X[:batch]
+        reference, flat = timed(model.predict, rows), timed(forest.predict, rows)
+        explain, bands = timed(forest.explain, rows), timed(interval, rows)
+        print('{:>6} {:>12.3f} {:>12.3f} {:>15.0f} {:>15.0f} {:>12.3f} {:>12.3f}'.format(
+            len(rows), reference * 1e3, flat * 1e3, len(rows) / reference, len(rows) / flat, explain * 1e3,
+            bands * 1e3))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""
+Import cost of the pipeline and serving modules.
+
+Imports every module in a fresh interpreter under `python -X importtime` (Python 3.7+) and
+reports its cumulative import time, the slowest modules it pulled in, and any of the heavy
+dependencies that were loaded eagerly. Times are the median over --repeat runs.
+
+    python benchmarks/import_time.py --modules configs.config,components.training --top 5
+"""
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODULES = ['configs.config', 'pipeline', 'components.data_extraction', 'components.data_validation',
+           'components.data_preparation', 'components.training', 'serving.registry', 'batch_score']
+
+# should only be imported by the functions that use them
+HEAVY = ['tensorflow_data_validation', 'tensorflow', 'wandb', 'sklearn', 'category_encoders', 'scipy', 'rich']
+
+
+def import_times(module: str) -> dict:
+    """Cumulative microseconds of every module imported by `import module`."""
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', 'import {}'.format(module)], cwd=ROOT,
+                            stdout=subprocess.PIPE, stderr=subprocess.PIPE, universal_newlines=True)
+    if result.returncode != 0:
+        raise RuntimeError('import {} failed:\n{}'.format(module, result.stderr.strip().splitlines()[-1]))
+    times = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # nested imports are indented by two spaces per level
+        times.setdefault(name.strip(), int(cumulative))
+    return times
+
+
+def measure(module: str, repeat: int, top: int) -> dict:
+    runs = [import_times(module) for _ in range(repeat)]
+    median = {name: statistics.median(run.get(name, 0) for run in runs) for name in runs[0]}
+    slowest = sorted((name for name in median if name != module), key=median.get, reverse=True)
+    return {
+        'module': module,
+        'ms': median.get(module, 0) / 1000,
+        'slowest': [(name, median[name] / 1000) for name in slowest[:top]],
+        'heavy': [name for name in HEAVY if name in median],
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modules', default=','.join(MODULES))
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--top', type=int, default=5, help='slowest imported modules listed per module')
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    if sys.version_info < (3, 7):
+        parser.error('-X importtime needs Python 3.7 or newer')
+
+    results = []
+    for module in args.modules.split(','):
+        try:
+            result = measure(module, args.repeat, args.top)
+        except RuntimeError as error:
+            print('{:<30} {}'.format(module, error))
+            continue
+        results.append(result)
+        print('{:<30} {:9.1f} ms   heavy: {}'.format(module, result['ms'], ', '.join(result['heavy']) or '-'))
+        for name, ms in result['slowest']:
+            print('    {:<36} {:9.1f} ms'.format(name, ms))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
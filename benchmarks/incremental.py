@@ -0,0 +1,106 @@
+"""
+Training time and test quality of incremental updates against full retrains, over several simulated crawl days.
+
+The training rows are shuffled and split into a base set and `--days` daily batches of `--new`
+of the rows each. Each day, the full retrain fits a new forest on every row seen so far. The
+incremental model is the previous day's model updated with update_forest() on that day's rows,
+as train_incremental() does. An update whose test MAE is more than `--tolerance` above that of its
+starting model is rejected, and the next day starts from the starting model again. Both are
+scored on the same test rows.
+
+    python benchmarks/incremental.py --data transformed-train.csv --test transformed-test.csv --days 5
+"""
+import argparse
+import copy
+import json
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from components.training.incremental import update_forest  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', required=True, help='transformed training CSV with a price column')
+    parser.add_argument('--test', default=None, help='transformed test CSV; a split of --data when omitted')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--days', type=int, default=5)
+    parser.add_argument('--new', type=float, default=0.02, help='fraction of the training rows added per day')
+    parser.add_argument('--params', default='{"n_estimators": 180}', help='forest parameters as JSON')
+    parser.add_argument('--trees', type=int, default=50, help='trees grown per update')
+    parser.add_argument('--replace', type=int, default=50, help='oldest trees dropped per update')
+    parser.add_argument('--replay', type=float, default=1.0, help='fraction of the earlier rows the new trees see')
+    parser.add_argument('--tolerance', type=float, default=0.01, help='relative MAE increase the gate accepts')
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    from sklearn.ensemble import RandomForestRegressor
+    from sklearn.metrics import mean_absolute_error, r2_score
+    from sklearn.model_selection import train_test_split
+
+    train = pd.read_csv(args.data)
+    if args.test:
+        test = pd.read_csv(args.test)
+    else:
+        train, test = train_test_split(train, test_size=args.test_size, random_state=0)
+    train = train.sample(frac=1, random_state=0)
+    X, y = train.drop(['price'], axis=1).to_numpy(dtype=np.float64), train['price'].to_numpy(dtype=np.float64)
+    X_test, y_test = test.drop(['price'], axis=1).to_numpy(dtype=np.float64), test['price'].to_numpy(dtype=np.float64)
+    per_day = int(len(X) * args.new)
+    base = len(X) - args.days * per_day
+    params = dict(json.loads(args.params), n_jobs=args.n_jobs)
+    print('{} base rows, {} new rows per day, {} test rows'.format(base, per_day, len(X_test)))
+
+    def score(model):
+        y_preds = model.predict(X_test)
+        return mean_absolute_error(y_test, y_preds), r2_score(y_test, y_preds)
+
+    started = time.perf_counter()
+    incremental = RandomForestRegressor(random_state=0, **params).fit(X[:base], y[:base])
+    print('day 0    full {:7.2f} s   test MAE {:9.3f}   R2 {:.4f}'.format(time.perf_counter() - started,
+                                                                          *score(incremental)))
+
+    results = []
+    for day in range(1, args.days + 1):
+        seen, end = base + (day - 1) * per_day, base + day * per_day
+
+        started = time.perf_counter()
+        full = RandomForestRegressor(random_state=day, **params).fit(X[:end], y[:end])
+        full_s = time.perf_counter() - started
+
+        previous = copy.deepcopy(incremental)
+        started = time.perf_counter()
+        incremental = update_forest(incremental, X[seen:end], y[seen:end], X[:seen], y[:seen], trees=args.trees,
+                                    replace=args.replace, replay=args.replay, random_state=day)
+        incremental_s = time.perf_counter() - started
+
+        (full_mae, full_r2), (mae, r2), (previous_mae, _) = score(full), score(incremental), score(previous)
+        results.append({'day': day, 'rows': end, 'full_s': full_s, 'incremental_s': incremental_s,
+                        'full_mae': full_mae, 'full_r2': full_r2, 'incremental_mae': mae, 'incremental_r2': r2,
+                        'previous_mae': previous_mae, 'gate_passed': mae <= previous_mae * (1 + args.tolerance),
+                        'trees': len(incremental.estimators_)})
+        print('day {day:<4} full {full_s:7.2f} s   test MAE {full_mae:9.3f}   R2 {full_r2:.4f}   |   '
+              'incremental {incremental_s:6.2f} s   test MAE {incremental_mae:9.3f}   R2 {incremental_r2:.4f}   '
+              'gate {gate}'.format(gate='passed' if results[-1]['gate_passed'] else 'rejected', **results[-1]))
+        if not results[-1]['gate_passed']:
+            incremental = previous
+
+    full_s, incremental_s = sum(r['full_s'] for r in results), sum(r['incremental_s'] for r in results)
+    print('{} days: full retrains {:.1f} s, incremental updates {:.1f} s ({:.1f}x faster); '
+          'last day test MAE {:+.2%} against the full retrain'.format(
+              args.days, full_s, incremental_s, full_s / incremental_s,
+              results[-1]['incremental_mae'] / results[-1]['full_mae'] - 1))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,208 @@
+"""
+Load test of the prediction API: latency percentiles, throughput and server memory
+for the single, batch and streaming endpoints.
+
+Requests replay NDJSON Input records (--records) and/or synthetic inputs drawn from
+the option lists of the Streamlit app. Without --url a local server is started.
+
+    python benchmarks/load_test.py --modes single,batch,stream --concurrency 1,8,32 --output results.json
+"""
+import argparse
+import ast
+import json
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import requests
+
+from workers import ROOT, memory_kb, process_tree
+
+ENDPOINTS = {'single': '/api/predict', 'batch': '/api/predict/batch', 'stream': '/api/predict/stream'}
+
+# app.py variable -> Input field
+APP_LISTS = {'branch_list': 'branch', 'origin_list': 'origin', 'internal_color_list': 'internal_color',
+             'external_color_list': 'external_color', 'gear_box_list': 'gearbox', 'wheel_drive_list': 'wheel_drive',
+             'feul_list': 'fuels', 'car_type_list': 'car_type', 'model_list': 'model'}
+
+
+def app_options(path: str) -> dict:
+    """
+    Category lists assigned in app.py, read with ast so that streamlit is not imported
+    """
+    with open(path, encoding='utf-8') as file:
+        tree = ast.parse(file.read())
+    options = {}
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Assign) and isinstance(node.value, ast.List):
+            for target in node.targets:
+                if isinstance(target, ast.Name) and target.id in APP_LISTS:
+                    options[APP_LISTS[target.id]] = [ast.literal_eval(item) for item in node.value.elts]
+    return options
+
+
+def synthetic_records(options: dict, n: int, seed: int = 0) -> list:
+    rng = random.Random(seed)
+    records = []
+    for _ in range(n):
+        record = {field: rng.choice(values) for field, values in options.items()}
+        record.update(year=rng.randint(2007, 2022), location='', km_driven=rng.randint(0, 200000),
+                      num_seats=rng.choice([4, 5, 7]), engine_capacity=round(rng.uniform(0.5, 6.0), 1))
+        records.append(record)
+    return records
+
+
+def read_records(path: str) -> list:
+    with open(path, encoding='utf-8') as file:
+        return [json.loads(line) for line in file if line.strip()]
+
+
+def make_request(mode: str, records: list, batch_size: int, index: int):
+    """
+    (json body, raw body, number of records) of the index-th request of a mode
+    """
+    if mode == 'single':
+        return records[index % len(records)], None, 1
+    start = (index * batch_size) % len(records)
+    chunk = (records[start:] + records[:start])[:batch_size]
+    if mode == 'batch':
+        return chunk, None, len(chunk)
+    body = ''.join(json.dumps(record, ensure_ascii=False) + '\n' for record in chunk).encode('utf-8')
+    return None, body, len(chunk)
+
+
+def run_mode(base_url: str, mode: str, records: list, concurrency: int, duration: float, batch_size: int) -> dict:
+    url = base_url + ENDPOINTS[mode]
+    stop = time.perf_counter() + duration
+
+    def worker(seed):
+        session, latencies, errors, rows, index = requests.Session(), [], 0, 0, seed
+        while time.perf_counter() < stop:
+            json_body, raw_body, count = make_request(mode, records, batch_size, index)
+            index += concurrency
+            start = time.perf_counter()
+            try:
+                response = session.post(url, json=json_body, data=raw_body)
+                response.raise_for_status()
+                response.content
+            except requests.RequestException:
+                errors += 1
+                continue
+            latencies.append(time.perf_counter() - start)
+            rows += count
+        return latencies, errors, rows
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        results = list(executor.map(worker, range(concurrency)))
+    elapsed = time.perf_counter() - start
+
+    latencies = np.array([value for result in results for value in result[0]]) * 1e3
+    p50, p95, p99 = np.percentile(latencies, [50, 95, 99]) if len(latencies) else (float('nan'),) * 3
+    return {
+        'mode': mode,
+        'concurrency': concurrency,
+        'batch_size': 1 if mode == 'single' else batch_size,
+        'requests': int(len(latencies)),
+        'errors': sum(result[1] for result in results),
+        'p50_ms': round(float(p50), 3),
+        'p95_ms': round(float(p95), 3),
+        'p99_ms': round(float(p99), 3),
+        'requests_per_s': round(len(latencies) / elapsed, 1),
+        'records_per_s': round(sum(result[2] for result in results) / elapsed, 1),
+    }
+
+
+def start_server(command: list, port: int, cache_size: int) -> subprocess.Popen:
+    env = dict(os.environ, CACHE_SIZE=str(cache_size))
+    server = subprocess.Popen(command + ['--port', str(port)], cwd=ROOT, env=env, stdout=subprocess.DEVNULL,
+                              stderr=subprocess.DEVNULL, start_new_session=True)
+    base_url = 'http://127.0.0.1:{}'.format(port)
+    deadline = time.time() + 300
+    while True:
+        try:
+            requests.get(base_url + '/api/health', timeout=5).raise_for_status()
+            return server
+        except requests.RequestException:
+            if time.time() > deadline or server.poll() is not None:
+                raise RuntimeError('Server did not come up')
+            time.sleep(0.5)
+
+
+def compare(results: list, baseline_path: str) -> None:
+    """
+    Print the change of every result against the same mode and concurrency in an earlier report
+    """
+    with open(baseline_path) as file:
+        baseline = {(item['mode'], item['concurrency']): item for item in json.load(file)['results']}
+    for result in results:
+        before = baseline.get((result['mode'], result['concurrency']))
+        if before is None:
+            continue
+        changes = ['{} {:+.1%}'.format(key, result[key] / before[key] - 1)
+                   for key in ('p50_ms', 'p99_ms', 'records_per_s') if before.get(key)]
+        print('{} x{}: {}'.format(result['mode'], result['concurrency'], ', '.join(changes)))
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=ROOT).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--url', default=None, help='API to test; a local server is started when omitted')
+    parser.add_argument('--server', default='uvicorn api:api --host 127.0.0.1', help='command of the local server')
+    parser.add_argument('--port', type=int, default=8098)
+    parser.add_argument('--cache-size', type=int, default=0, help='CACHE_SIZE of the local server')
+    parser.add_argument('--records', default=None, help='NDJSON file of Input records to replay')
+    parser.add_argument('--synthetic', type=int, default=1000, help='synthetic records drawn from app.py options')
+    parser.add_argument('--modes', default='single,batch,stream')
+    parser.add_argument('--concurrency', default='1,8,32')
+    parser.add_argument('--batch-size', type=int, default=100)
+    parser.add_argument('--duration', type=float, default=10.0, help='seconds per mode and concurrency level')
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    parser.add_argument('--baseline', default=None, help='earlier --output report to compare against')
+    args = parser.parse_args()
+
+    records = read_records(args.records) if args.records else []
+    records += synthetic_records(app_options(os.path.join(ROOT, 'app.py')), args.synthetic)
+
+    server = None
+    if args.url is None:
+        server = start_server(args.server.split(), args.port, args.cache_size)
+    base_url = args.url or 'http://127.0.0.1:{}'.format(args.port)
+
+    results = []
+    try:
+        for mode in args.modes.split(','):
+            for concurrency in [int(level) for level in args.concurrency.split(',')]:
+                result = run_mode(base_url, mode, records, concurrency, args.duration, args.batch_size)
+                if server is not None:
+                    memory = [memory_kb(pid) for pid in process_tree(server.pid)]
+                    result['server_rss_mb'] = round(sum(item['rss'] for item in memory) / 1024, 1)
+                print(json.dumps(result), flush=True)
+                results.append(result)
+    finally:
+        if server is not None:
+            os.killpg(server.pid, signal.SIGTERM)
+            server.wait()
+
+    if args.baseline:
+        compare(results, args.baseline)
+    if args.output:
+        report = {'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'commit': git_commit(), 'url': base_url,
+                  'records': len(records), 'args': vars(args), 'results': results}
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
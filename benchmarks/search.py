@@ -0,0 +1,76 @@
+"""
+Wall time, total fit time and test quality of the training hyperparameter searches on the same data.
+
+The searches run with the settings train() uses. Total fit time sums the fit time of every
+(configuration, fold) the search tried. It stands for the CPU time spent, whatever the core count.
+
+    python benchmarks/search.py --data transformed-train.csv --test transformed-test.csv
+"""
+import argparse
+import json
+import os
+import sys
+import time
+
+import pandas as pd
+
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from components.training.search import SEARCHES, fit_seconds, make_search  # noqa: E402
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', required=True, help='transformed training CSV with a price column')
+    parser.add_argument('--test', default=None, help='transformed test CSV; a split of --data when omitted')
+    parser.add_argument('--test-size', type=float, default=0.2)
+    parser.add_argument('--searches', default=','.join(SEARCHES))
+    parser.add_argument('--n-jobs', type=int, default=-1)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    from sklearn.metrics import mean_absolute_error, r2_score
+    from sklearn.model_selection import train_test_split
+
+    train = pd.read_csv(args.data)
+    if args.test:
+        test = pd.read_csv(args.test)
+    else:
+        train, test = train_test_split(train, test_size=args.test_size, random_state=0)
+    X_train, y_train = train.drop(['price'], axis=1), train['price']
+    X_test, y_test = test.drop(['price'], axis=1), test['price']
+    print('{} training rows, {} test rows'.format(len(train), len(test)))
+
+    results = []
+    for kind in args.searches.split(','):
+        search = make_search(kind, n_jobs=args.n_jobs, verbose=0)
+        started = time.perf_counter()
+        search.fit(X_train, y_train)
+        wall = time.perf_counter() - started
+        y_preds = search.best_estimator_.predict(X_test)
+        results.append({
+            'search': kind,
+            'wall_s': wall,
+            'fit_s': fit_seconds(search),
+            'fits': len(search.cv_results_['params']) * search.n_splits_,
+            'test_mae': mean_absolute_error(y_test, y_preds),
+            'test_r2': r2_score(y_test, y_preds),
+            'best_params': search.best_params_,
+        })
+        print('{search:<8} wall {wall_s:8.1f} s   fits {fits:4d}   fit time {fit_s:8.1f} s   '
+              'test MAE {test_mae:9.3f}   R2 {test_r2:.4f}'.format(**results[-1]))
+        print('         best {}'.format(search.best_params_))
+
+    if len(results) > 1:
+        base = results[0]
+        for result in results[1:]:
+            print('{} against {}: {:.2f}x wall time, {:.2f}x fit time, test MAE {:+.2%}'.format(
+                result['search'], base['search'], result['wall_s'] / base['wall_s'], result['fit_s'] / base['fit_s'],
+                result['test_mae'] / base['test_mae'] - 1))
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,106 @@
+"""
+Peak memory and fit throughput of the training searches on sklearn's joblib backend against the
+persistent process pool over memory-mapped folds, as the number of worker processes grows.
+
+Memory is the proportional set size (PSS) summed over this process and all its children,
+sampled every 0.1 s. Larger training sets are simulated by repeating the rows of --data with
+a little noise. Linux only.
+
+    python benchmarks/training_executor.py --data transformed-train.csv --rows 200000 --workers 1,2,4
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+
+import numpy as np
+import pandas as pd
+
+from workers import ROOT, memory_kb, process_tree
+
+sys.path.append(ROOT)
+from components.training.search import BACKENDS, make_search  # noqa: E402
+
+
+class PeakMemory:
+    def __init__(self, interval: float = 0.1) -> None:
+        self.interval = interval
+        self.peak_kb = 0
+        self.stopping = threading.Event()
+        self.thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self) -> None:
+        while not self.stopping.wait(self.interval):
+            total = 0
+            for pid in process_tree(os.getpid()):
+                try:
+                    total += memory_kb(pid).get('pss', 0)
+                except OSError:
+                    # the process exited between listing and reading
+                    pass
+            self.peak_kb = max(self.peak_kb, total)
+
+    def __enter__(self) -> 'PeakMemory':
+        self.thread.start()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.stopping.set()
+        self.thread.join()
+
+
+def load(path: str, rows: int, seed: int = 0):
+    frame = pd.read_csv(path)
+    X, y = frame.drop(['price'], axis=1).to_numpy(dtype=np.float64), frame['price'].to_numpy(dtype=np.float64)
+    if rows > len(X):
+        rng = np.random.RandomState(seed)
+        picks = rng.randint(0, len(X), rows)
+        X = X[picks] * rng.normal(1, 0.01, (rows, X.shape[1]))
+        y = y[picks]
+    return X, y
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--data', required=True, help='transformed training CSV with a price column')
+    parser.add_argument('--rows', type=int, default=0, help='resample the data to this many rows')
+    parser.add_argument('--search', default='halving')
+    parser.add_argument('--candidates', type=int, default=20)
+    parser.add_argument('--backends', default=','.join(BACKENDS))
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    X, y = load(args.data, args.rows)
+    print('{} rows x {} features, {:.1f} MB'.format(X.shape[0], X.shape[1], X.nbytes / 2 ** 20))
+
+    results = []
+    for workers in [int(count) for count in args.workers.split(',')]:
+        for backend in args.backends.split(','):
+            search = make_search(args.search, backend=backend, n_candidates=args.candidates, n_jobs=workers,
+                                 verbose=0)
+            with PeakMemory() as memory:
+                started = time.perf_counter()
+                search.fit(X, y)
+                wall = time.perf_counter() - started
+            fits = len(search.cv_results_['params']) * search.n_splits_
+            results.append({
+                'backend': backend,
+                'workers': workers,
+                'wall_s': round(wall, 2),
+                'fits': fits,
+                'fits_per_s': round(fits / wall, 3),
+                'peak_pss_mb': round(memory.peak_kb / 1024, 1),
+                'best_score': round(float(search.best_score_), 4),
+            })
+            print(json.dumps(results[-1]), flush=True)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
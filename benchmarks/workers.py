@@ -0,0 +1,130 @@
+"""
+Per-worker memory and throughput of the API across serving modes and worker counts.
+
+Starts the server, waits for it to answer, drives /api/predict from a thread pool and
+reads RSS and PSS (proportional set size, which splits shared pages between the
+processes mapping them) of every server process from /proc. Linux only.
+
+    python benchmarks/workers.py --workers 1,2,4 --modes uvicorn,prefork
+"""
+import argparse
+import json
+import os
+import signal
+import subprocess
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+SAMPLE = {'year': 2019, 'location': '', 'branch': 'Honda', 'model': 'CRV', 'origin': 'domestic', 'km_driven': 20000,
+          'external_color': 'Trắng', 'internal_color': 'Đen', 'num_seats': 5, 'fuels': 'gasoline',
+          'engine_capacity': 1.5, 'gearbox': 'automatic', 'wheel_drive': 'FWD', 'car_type': 'suv'}
+
+MODES = {
+    # one independent process per worker, each unpickling and flattening its own model
+    'uvicorn': (['uvicorn', 'api:api', '--host', '127.0.0.1', '--port', '{port}', '--workers', '{workers}'],
+                {'FOREST_MMAP': 'False'}),
+    # model loaded once in the gunicorn master, forest arrays memory-mapped
+    'prefork': (['gunicorn', '-c', 'gunicorn.conf.py', 'api:api'],
+                {'FOREST_MMAP': 'True', 'PORT': '{port}', 'WEB_CONCURRENCY': '{workers}'}),
+}
+
+
+def process_tree(pid: int) -> list:
+    pids, pending = [], [pid]
+    while pending:
+        current = pending.pop()
+        pids.append(current)
+        for task in os.listdir('/proc/{}/task'.format(current)):
+            with open('/proc/{}/task/{}/children'.format(current, task)) as file:
+                pending.extend(int(child) for child in file.read().split())
+    return pids
+
+
+def memory_kb(pid: int) -> dict:
+    values = {}
+    with open('/proc/{}/smaps_rollup'.format(pid)) as file:
+        for line in file:
+            key, _, rest = line.partition(':')
+            if key in ('Rss', 'Pss'):
+                values[key.lower()] = int(rest.split()[0])
+    return values
+
+
+def drive(url: str, concurrency: int, duration: float) -> float:
+    def worker(_):
+        session = requests.Session()
+        done, stop = 0, time.perf_counter() + duration
+        while time.perf_counter() < stop:
+            session.post(url, json=dict(SAMPLE, km_driven=SAMPLE['km_driven'] + done)).raise_for_status()
+            done += 1
+        return done
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as executor:
+        total = sum(executor.map(worker, range(concurrency)))
+    return total / (time.perf_counter() - start)
+
+
+def run(mode: str, workers: int, port: int, concurrency: int, duration: float) -> dict:
+    command, env = MODES[mode]
+    fill = {'port': port, 'workers': workers}
+    env = dict(os.environ, CACHE_SIZE='0', **{key: value.format(**fill) for key, value in env.items()})
+    server = subprocess.Popen([part.format(**fill) for part in command], cwd=ROOT, env=env,
+                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL, start_new_session=True)
+    url = 'http://127.0.0.1:{}/api/predict'.format(port)
+    try:
+        deadline = time.time() + 300
+        while True:
+            try:
+                requests.post(url, json=SAMPLE, timeout=5).raise_for_status()
+                break
+            except requests.RequestException:
+                if time.time() > deadline or server.poll() is not None:
+                    raise RuntimeError('{} server did not come up'.format(mode))
+                time.sleep(0.5)
+
+        throughput = drive(url, concurrency, duration)
+        memory = [memory_kb(pid) for pid in process_tree(server.pid)]
+        return {
+            'mode': mode,
+            'workers': workers,
+            'processes': len(memory),
+            'requests_per_s': round(throughput, 1),
+            'rss_total_mb': round(sum(item['rss'] for item in memory) / 1024, 1),
+            'pss_total_mb': round(sum(item['pss'] for item in memory) / 1024, 1),
+            'pss_per_worker_mb': round(sum(item['pss'] for item in memory) / 1024 / workers, 1),
+        }
+    finally:
+        os.killpg(server.pid, signal.SIGTERM)
+        server.wait()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--modes', default='uvicorn,prefork')
+    parser.add_argument('--workers', default='1,2,4')
+    parser.add_argument('--concurrency', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--port', type=int, default=8099)
+    parser.add_argument('--output', default=None, help='write the results as JSON')
+    args = parser.parse_args()
+
+    results = []
+    for mode in args.modes.split(','):
+        for workers in [int(count) for count in args.workers.split(',')]:
+            result = run(mode, workers, args.port, args.concurrency, args.duration)
+            print(json.dumps(result), flush=True)
+            results.append(result)
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=2)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
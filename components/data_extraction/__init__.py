@@ -2,7 +2,6 @@ import json
 import requests
 import pandas as pd
 
-import wandb
 from decouple import config
 
 
@@ -35,6 +34,8 @@ def fetch_data():
 
 
 def extract_data(project):
+    import wandb
+
     run = wandb.init(project=project, job_type="data-extraction")
 
     # Create a sample dataset to log as an artifact
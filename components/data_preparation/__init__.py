@@ -1,8 +1,4 @@
 import pandas as pd
-import wandb
-
-import category_encoders as ce
-from scipy import stats
 import numpy as np
 import pickle
 
@@ -84,6 +80,8 @@ def filter_category_feature(df: pd.DataFrame) -> pd.DataFrame:
 
 
 def filter_outline_target(df: pd.DataFrame, z_score: float = 2.8) -> pd.DataFrame:
+    from scipy import stats
+
     df = df[(np.abs(stats.zscore(df.price)) < z_score)]
     return df
 
@@ -95,6 +93,8 @@ class Transform:
         self.df_val = df_val
 
         # init encoder
+        import category_encoders as ce
+
         self.encoder_branch = ce.JamesSteinEncoder()
         self.encoder_model = ce.JamesSteinEncoder()
         self.encoder_others = ce.OrdinalEncoder()
@@ -124,6 +124,8 @@ class Transform:
 
 
 def prepare_data(project):
+    import wandb
+
     # Load data
     run = wandb.init(project=project, job_type="data-preparation")
     artifact = run.use_artifact('train-data:latest')
@@ -1,20 +1,30 @@
 import os
-import wandb
 import pandas as pd
 
-import pkg_resources
 import importlib
-
-import tensorflow_data_validation as tfdv
-from sklearn.model_selection import train_test_split
-from tensorflow_data_validation.utils.display_util import get_statistics_html
+from functools import lru_cache
 
 import warnings
-warnings.filterwarnings("ignore")
-importlib.reload(pkg_resources)
+
+
+@lru_cache(maxsize=None)
+def load_tfdv():
+    """
+    Import TFDV on first use. pkg_resources is reloaded first so that freshly installed
+    distributions are visible to it
+    """
+    import pkg_resources
+    warnings.filterwarnings("ignore")
+    importlib.reload(pkg_resources)
+    import tensorflow_data_validation as tfdv
+    return tfdv
 
 
 def infer_schema(project: str, artifact_name='raw-dataset:latest', filename='raw-dataset', is_running=True, run=None):
+    import wandb
+    from sklearn.model_selection import train_test_split
+    tfdv = load_tfdv()
+
     # Initialize a new W&B run to track this job
     if not is_running:
         run = wandb.init(project=project, job_type="infer-schema")
@@ -62,6 +72,9 @@ def infer_schema(project: str, artifact_name='raw-dataset:latest', filename='raw
 
 
 def get_schema(project, artifact_name='text-schema:latest', is_running=True, run=None):
+    import wandb
+    tfdv = load_tfdv()
+
     if not is_running:
         run = wandb.init(project=project, job_type="download-schema")
     schema = None
@@ -81,6 +94,10 @@ def get_schema(project, artifact_name='text-schema:latest', is_running=True, run
 
 
 def validate_data(project):
+    import wandb
+    from sklearn.model_selection import train_test_split
+    tfdv = load_tfdv()
+
     run = wandb.init(project=project, job_type="data-validation")
     # Pull down that dataset you logged in the last run
     artifact = run.use_artifact('raw-dataset:latest')
@@ -133,10 +150,12 @@ def validate_data(project):
     serving_stats = tfdv.generate_statistics_from_dataframe(dataframe=test_df)
 
     # log statistics
-    file = get_statistics_html(lhs_statistics=eva_stats,
-                               rhs_statistics=train_stats,
-                               lhs_name='VAL_DATASET',
-                               rhs_name='TRAIN_DATASET')
+    file = tfdv.utils.display_util.get_statistics_html(
+        lhs_statistics=eva_stats,
+        rhs_statistics=train_stats,
+        lhs_name='VAL_DATASET',
+        rhs_name='TRAIN_DATASET'
+    )
     artifact = wandb.Artifact('statistic', type='Statistic')
     html = wandb.Html(data=file)
     artifact.add(html, 'Statistic')
@@ -1,5 +1,6 @@
 import sys
 sys.path.append("..")
+sys.path.append("../..")
 
 if __name__ == '__main__':
     from training import train
@@ -1,41 +1,48 @@
-import wandb
+import os
+import time
 import numpy as np
 import pandas as pd
 import pickle
 
-from sklearn.ensemble import RandomForestRegressor
-from sklearn.model_selection import RandomizedSearchCV
-from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
-
-
-n_estimators = [int(x) for x in np.linspace(start = 20, stop = 300, num = 10)]
-# Number of features to consider at every split
-max_features = ['auto', 'sqrt']
-# Maximum number of levels in tree
-max_depth = [int(x) for x in np.linspace(10, 110, num = 11)]
-max_depth.append(None)
-# Minimum number of samples required to split a node
-min_samples_split = [2, 5, 10]
-# Minimum number of samples required at each leaf node
-min_samples_leaf = [1, 2, 4]
-# Method of selecting samples for training each tree
-bootstrap = [True, False]
-# Create the random grid
-random_grid = {'n_estimators': n_estimators,
-               'max_features': max_features,
-               'max_depth': max_depth,
-               'min_samples_split': min_samples_split,
-               'min_samples_leaf': min_samples_leaf,
-               'bootstrap': bootstrap}
-
-
-def train(project):
+from decouple import config
+
+
+def load_transform(run, name):
+    artifact_dir = run.use_artifact('{}:latest'.format(name)).download()
+    with open(os.path.join(artifact_dir, '{}.pkl'.format(name)), 'rb') as file:
+        return pickle.load(file)
+
+
+def train(project, search=None, backend=None, engine=None):
+    """
+    `engine` is one of components.training.engines.ENGINES, TRAIN_ENGINE from the environment by
+    default. The random forest engine searches its hyperparameters: `search` and `backend` are one
+    of components.training.search.SEARCHES and BACKENDS, TRAIN_SEARCH and TRAIN_BACKEND by default.
+    On the pool backend, finished trials are kept in TRAIN_TRIAL_STORE, so a rerun on the same data
+    skips them, and TRAIN_WARM_START of the best stored configurations are tried again.
+    """
+    import wandb
+    from sklearn.metrics import mean_squared_error, r2_score, mean_absolute_error
+
+    from components.training.incremental import ROW_HASHES, clean_rows, load_dataset, row_hashes
+    from components.training.engines import make_engine
+    from components.training.trials import TrialStore
+    from configs.config import STORES_DIR
+    from serving.bundle import save_bundle
+    from serving.drift import reference_statistics
+    from serving.encoders import CompiledEncoders
+    from serving.forest import FlatForest
+
     run = wandb.init(project=project, job_type='training')
 
     artifact = run.use_artifact('transformed-train-data:latest')
     artifact_data = artifact.get("transformed-train-data")
     df_train = pd.DataFrame(columns=artifact_data.columns, data=artifact_data.data)
 
+    artifact = run.use_artifact('transformed-val-data:latest')
+    artifact_data = artifact.get("transformed-val-data")
+    df_val = pd.DataFrame(columns=artifact_data.columns, data=artifact_data.data)
+
     artifact = run.use_artifact('transformed-test-data:latest')
     artifact_data = artifact.get("transformed-test-data")
     df_test = pd.DataFrame(columns=artifact_data.columns, data=artifact_data.data)
@@ -43,33 +50,59 @@ def train(project):
     X_train = df_train.drop(['price'], axis=1)
     y_train = df_train['price']
 
+    X_val = df_val.drop(['price'], axis=1)
+    y_val = df_val['price']
+
     X_test = df_test.drop(['price'], axis=1)
     y_test = df_test['price']
 
-    rf = RandomForestRegressor()
-    # Random search of parameters, using 3 fold cross validation,
-    # search across 100 different combinations, and use all available cores
-    rf_random = RandomizedSearchCV(estimator=rf, param_distributions=random_grid, n_iter=20, cv=5, verbose=2,
-                                   random_state=42, n_jobs=-1)
-
-    rf_random.fit(X_train, y_train)
-    best_model = rf_random.best_estimator_
+    engine = engine or config('TRAIN_ENGINE', default='random_forest')
+    options = {}
+    if engine == 'random_forest':
+        # 20 candidate configurations, narrowed by successive halving unless TRAIN_SEARCH=random,
+        # with 5 fold cross validation on all available cores
+        search = search or config('TRAIN_SEARCH', default='halving')
+        backend = backend or config('TRAIN_BACKEND', default='pool')
+        store_path = config('TRAIN_TRIAL_STORE', default=os.path.join(str(STORES_DIR), 'trials.jsonl'))
+        trial_store = TrialStore(store_path) if backend == 'pool' and store_path else None
+        warm_start = config('TRAIN_WARM_START', default=0, cast=int) if trial_store is not None else 0
+        options = {'search': search, 'backend': backend, 'trial_store': trial_store, 'warm_start': warm_start}
+    trainer = make_engine(engine, **options)
+    started = time.perf_counter()
+    trainer.fit(X_train, y_train, X_val, y_val)
+    train_time = time.perf_counter() - started
+    best_model = trainer.model
 
     y_preds = best_model.predict(X_test)
     mae = mean_absolute_error(y_preds, y_test)
     mse = mean_squared_error(y_preds, y_test)
     r2 = r2_score(y_preds, y_test)
 
-    wandb.sklearn.plot_feature_importances(best_model, list(df_train.columns))
-    wandb.config.update(rf_random.best_params_)
+    if hasattr(best_model, 'feature_importances_'):
+        wandb.sklearn.plot_feature_importances(best_model, list(df_train.columns))
+    wandb.config.update(trainer.params)
+    wandb.config.update(dict(trainer.info, engine=engine, **{'train-time': train_time}))
     wandb.config.update({'mse-test': mse, 'mae-test': mae, 'r2-test': r2})
 
     # log best model
     with open('model.pkl', 'wb') as file:
         pickle.dump(best_model, file)
 
+    # serving bundle: the encoders fitted by prepare_data with the flattened trees
+    encoders = CompiledEncoders.from_encoders(load_transform(run, 'branch-func'), load_transform(run, 'model-func'),
+                                              load_transform(run, 'other-func'))
+    df_raw = load_dataset(run, 'train-data')
+    # the rows this model has seen, for incremental training
+    np.save(ROW_HASHES, row_hashes(df_raw))
+    # drift reference: the training rows with the missing values and filters of prepare_data
+    save_bundle('bundle', FlatForest.from_estimator(best_model), encoders, kind=trainer.kind,
+                metadata={'mse-test': mse, 'mae-test': mae, 'r2-test': r2},
+                reference=reference_statistics(clean_rows(df_raw)))
+
     artifact = wandb.Artifact('model', type='Model')
     artifact.add_file('model.pkl')
+    artifact.add_file(ROW_HASHES)
+    artifact.add_dir('bundle', name='bundle')
     run.log_artifact(artifact)
 
     wandb.finish()
@@ -0,0 +1,110 @@
+"""
+The estimators train() can fit, behind one interface.
+
+An engine is created with make_engine() and fitted with `fit(X_train, y_train, X_val, y_val)`. It then
+holds the fitted sklearn estimator in `model`, its chosen hyperparameters in `params`, and details of
+how it was trained in `info`. All three are logged to the wandb run. Its `kind` names the serving
+bundle kind, and FlatForest.from_estimator exports either model for serving.
+
+`random_forest` is the hyperparameter search of components.training.search and ignores the
+validation rows. `gradient_boosting` is HistGradientBoostingRegressor. It bins every feature into at
+most `max_bins` values and grows the trees on histograms of those bins rather than on the raw values.
+It adds trees `step` at a time until the validation MSE has not improved for `patience` steps, and
+keeps the trees up to the best step.
+"""
+import math
+import time
+
+from components.training.search import fit_seconds, make_search, random_forest
+
+
+ENGINES = ('random_forest', 'gradient_boosting')
+
+
+class RandomForestEngine:
+    kind = 'random_forest'
+
+    def __init__(self, search: str = 'halving', backend: str = 'pool', trial_store=None, warm_start: int = 0,
+                 params: dict = None, n_jobs: int = -1, verbose: int = 2) -> None:
+        """
+        `params` fits that single configuration instead of searching
+        """
+        self.search = search
+        self.backend = backend
+        self.trial_store = trial_store
+        self.warm_start = warm_start
+        self.params = params
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+        self.info = {}
+
+    def fit(self, X_train, y_train, X_val=None, y_val=None) -> 'RandomForestEngine':
+        if self.params is not None:
+            self.model = random_forest(n_jobs=self.n_jobs, **self.params).fit(X_train, y_train)
+            return self
+
+        search = make_search(self.search, backend=self.backend, n_jobs=self.n_jobs, verbose=self.verbose,
+                             trial_store=self.trial_store, warm_start=self.warm_start)
+        started = time.perf_counter()
+        search.fit(X_train, y_train)
+        self.model, self.params = search.best_estimator_, search.best_params_
+        self.info = {'search': self.search, 'search-backend': self.backend,
+                     'search-time': time.perf_counter() - started, 'search-fit-time': fit_seconds(search),
+                     'search-resumed-trials': getattr(search, 'n_resumed_', 0)}
+        return self
+
+
+class GradientBoostingEngine:
+    kind = 'gradient_boosting'
+
+    def __init__(self, learning_rate: float = 0.1, max_leaf_nodes: int = 31, min_samples_leaf: int = 20,
+                 l2_regularization: float = 0.0, max_bins: int = 255, max_iter: int = 1000, step: int = 10,
+                 patience: int = 3) -> None:
+        self.params = {'learning_rate': learning_rate, 'max_leaf_nodes': max_leaf_nodes,
+                       'min_samples_leaf': min_samples_leaf, 'l2_regularization': l2_regularization,
+                       'max_bins': max_bins}
+        self.max_iter = max_iter
+        self.step = step
+        self.patience = patience
+        self.info = {}
+
+    def fit(self, X_train, y_train, X_val, y_val) -> 'GradientBoostingEngine':
+        from sklearn.metrics import mean_squared_error
+        try:
+            from sklearn.ensemble import HistGradientBoostingRegressor
+        except ImportError:
+            # still experimental in sklearn 0.24
+            from sklearn.experimental import enable_hist_gradient_boosting  # noqa: F401
+            from sklearn.ensemble import HistGradientBoostingRegressor
+
+        # sklearn's own early stopping scores on a split of the training rows, not on the validation split
+        model = HistGradientBoostingRegressor(max_iter=self.step, early_stopping=False, warm_start=True,
+                                              **self.params)
+        best_iter, best_loss, stale = 0, math.inf, 0
+        while stale < self.patience and model.max_iter <= self.max_iter:
+            model.fit(X_train, y_train)
+            loss = mean_squared_error(y_val, model.predict(X_val))
+            if loss < best_loss:
+                best_iter, best_loss, stale = model.n_iter_, loss, 0
+            else:
+                stale += 1
+            model.set_params(max_iter=model.max_iter + self.step)
+
+        # drop the trees grown after the best step; n_iter_ is the number of _predictors
+        del model._predictors[best_iter:]
+        model.set_params(max_iter=best_iter, warm_start=False)
+        self.model = model
+        self.params = dict(self.params, max_iter=best_iter)
+        self.info = {'early-stopping-iterations': best_iter, 'val-mse': best_loss}
+        return self
+
+
+def make_engine(kind: str = 'random_forest', **options):
+    """
+    An unfitted engine; `options` are the keyword arguments of its class
+    """
+    if kind == 'random_forest':
+        return RandomForestEngine(**options)
+    if kind == 'gradient_boosting':
+        return GradientBoostingEngine(**options)
+    raise ValueError('Unknown engine {!r}, expected one of {}'.format(kind, ENGINES))
@@ -0,0 +1,263 @@
+"""
+Hyperparameter searches on a persistent process pool over memory-mapped fold data.
+
+The feature matrix, the target and the indices of every CV fold are written once as .npy files.
+Each worker process memory-maps them when it starts, so the data is neither pickled per fit
+nor copied per worker. A search then submits (configuration, fold) tasks, longest first, to
+the same pool for every iteration, and refits the best configuration on all rows at the end.
+`PoolSearch` has the attributes of sklearn's searches that train() uses (`best_params_`,
+`best_estimator_`, `best_score_`, `cv_results_`, `n_splits_`).
+
+With a `trial_store` (components.training.trials), every finished trial is recorded as it
+completes and trials already recorded for the same data are not fitted again, so a search that
+was interrupted resumes where it stopped. `warm_start` seeds the candidates with the best
+configurations the store holds from earlier searches.
+"""
+import math
+import os
+import shutil
+import tempfile
+import time
+from multiprocessing import Pool
+
+import numpy as np
+
+from components.training.trials import data_digest, params_key
+
+
+class FoldData:
+    """
+    X, y and the train/test indices of each fold as .npy files in `directory`
+    """
+
+    def __init__(self, directory: str, n_splits: int) -> None:
+        self.directory = directory
+        self.n_splits = n_splits
+
+    @classmethod
+    def create(cls, X, y, cv: int = 5, directory: str = None) -> 'FoldData':
+        from sklearn.model_selection import check_cv
+
+        directory = directory or tempfile.mkdtemp(prefix='mlops-folds-')
+        os.makedirs(directory, exist_ok=True)
+        X = np.ascontiguousarray(X, dtype=np.float64)
+        y = np.ascontiguousarray(y, dtype=np.float64)
+        np.save(os.path.join(directory, 'X.npy'), X)
+        np.save(os.path.join(directory, 'y.npy'), y)
+        # the same KFold sklearn's searches use for a regressor
+        splits = list(check_cv(cv, y, classifier=False).split(X, y))
+        for fold, (train, test) in enumerate(splits):
+            np.save(os.path.join(directory, 'train-{}.npy'.format(fold)), train)
+            np.save(os.path.join(directory, 'test-{}.npy'.format(fold)), test)
+        return cls(directory, len(splits))
+
+    def load(self, mmap_mode: str = 'r'):
+        def load(name):
+            return np.load(os.path.join(self.directory, name + '.npy'), mmap_mode=mmap_mode)
+
+        folds = [(load('train-{}'.format(fold)), load('test-{}'.format(fold))) for fold in range(self.n_splits)]
+        return load('X'), load('y'), folds
+
+    def remove(self) -> None:
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+
+_data = None
+
+
+def _init_worker(directory: str, n_splits: int) -> None:
+    global _data
+    _data = FoldData(directory, n_splits).load()
+
+
+def _fit_trial(factory, params: dict, fold: int):
+    X, y, folds = _data
+    train, test = folds[fold]
+    estimator = factory(**params)
+    started = time.perf_counter()
+    estimator.fit(X[train], y[train])
+    fit_time = time.perf_counter() - started
+    return estimator.score(X[test], y[test]), fit_time
+
+
+def _fit_indexed(task):
+    i, factory, params, fold = task
+    return i, _fit_trial(factory, params, fold)
+
+
+def n_workers(n_jobs: int) -> int:
+    """
+    joblib's convention: -1 is every core, -2 all but one and so on
+    """
+    cores = os.cpu_count() or 1
+    return max(1, n_jobs if n_jobs > 0 else cores + 1 + n_jobs)
+
+
+def log_floor(n: int, base: int) -> int:
+    """
+    Largest k with base ** k <= n
+    """
+    k = 0
+    while base ** (k + 1) <= n:
+        k += 1
+    return k
+
+
+class TrialExecutor:
+    """
+    Process pool that fits and scores (configuration, fold) trials on memory-mapped FoldData
+    """
+
+    def __init__(self, data: FoldData, n_jobs: int = -1) -> None:
+        self.data = data
+        self.workers = n_workers(n_jobs)
+        # multiprocessing.Pool rather than ProcessPoolExecutor: its initializer needs Python 3.7
+        self.pool = Pool(self.workers, initializer=_init_worker, initargs=(data.directory, data.n_splits))
+
+    def run(self, factory, trials, cost=None, done=None) -> list:
+        """
+        (score, fit time) of each (params, fold) in `trials`, in order. Trials are submitted by
+        decreasing `cost(params)` so the longest fits do not end up last. `done(params, fold, result)`
+        is called in this process as each trial finishes.
+        """
+        order = sorted(range(len(trials)), key=lambda i: -cost(trials[i][0])) if cost else range(len(trials))
+        tasks = [(i, factory) + tuple(trials[i]) for i in order]
+        results = [None] * len(trials)
+        # chunksize 1 keeps the submission order and yields each trial as soon as it finishes
+        for i, result in self.pool.imap_unordered(_fit_indexed, tasks, chunksize=1):
+            results[i] = result
+            if done:
+                done(*trials[i], results[i])
+        return results
+
+    def close(self) -> None:
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self) -> 'TrialExecutor':
+        return self
+
+    def __exit__(self, exc_type, exc, traceback) -> None:
+        if exc_type is None:
+            self.close()
+        else:
+            # do not wait for the queued trials of a search that failed
+            self.pool.terminate()
+            self.pool.join()
+
+
+class PoolSearch:
+    """
+    Random search or successive halving, with the semantics of RandomizedSearchCV and
+    HalvingRandomSearchCV, run on a TrialExecutor. Configurations are drawn with the same
+    ParameterSampler, so a given `random_state` tries the same candidates as sklearn.
+    """
+
+    def __init__(self, factory, param_distributions: dict, kind: str = 'halving', n_candidates: int = 20,
+                 cv: int = 5, resource: str = 'n_estimators', min_resources: int = 20, max_resources: int = 300,
+                 factor: int = 3, random_state: int = 42, n_jobs: int = -1, verbose: int = 0, trial_store=None,
+                 warm_start: int = 0) -> None:
+        self.factory = factory
+        self.param_distributions = param_distributions
+        self.kind = kind
+        self.n_candidates = n_candidates
+        self.cv = cv
+        self.resource = resource
+        self.min_resources = min_resources
+        self.max_resources = max_resources
+        self.factor = factor
+        self.random_state = random_state
+        self.n_jobs = n_jobs
+        self.verbose = verbose
+        self.trial_store = trial_store
+        self.warm_start = warm_start
+
+    def fit(self, X, y) -> 'PoolSearch':
+        from sklearn.model_selection import ParameterSampler
+
+        self.cv_results_ = {'params': [], 'mean_test_score': [], 'std_test_score': [], 'mean_fit_time': [],
+                            'iter': [], 'n_resources': []}
+        self.n_resumed_ = 0
+        data = FoldData.create(X, y, cv=self.cv)
+        self.n_splits_ = data.n_splits
+        try:
+            self.data_digest_ = data_digest(X, y, self.cv) if self.trial_store is not None else None
+            candidates = list(ParameterSampler(self.param_distributions, self.n_candidates,
+                                               random_state=self.random_state))
+            if self.warm_start and self.trial_store is not None:
+                candidates = self._seed(candidates)
+            with TrialExecutor(data, n_jobs=self.n_jobs) as executor:
+                if self.kind == 'halving':
+                    best = self._halving(executor, candidates)
+                else:
+                    best = self._evaluate(executor, candidates, 0)[0]
+        finally:
+            data.remove()
+
+        self.best_params_, self.best_score_ = best
+        self.best_estimator_ = self.factory(**self.best_params_)
+        if 'n_jobs' in self.best_estimator_.get_params():
+            self.best_estimator_.set_params(n_jobs=self.n_jobs)
+        self.best_estimator_.fit(X, y)
+        return self
+
+    def _seed(self, candidates: list) -> list:
+        """
+        The best `warm_start` stored configurations first, then sampled ones up to `n_candidates`
+        """
+        seeds = self.trial_store.best(self.warm_start, self.n_splits_, names=set(self.param_distributions))
+        seeds = [params for params in seeds if set(params) == set(self.param_distributions)]
+        keys = {params_key(params) for params in seeds}
+        sampled = [params for params in candidates if params_key(params) not in keys]
+        if self.verbose:
+            print('warm start: {} stored configurations seeded'.format(len(seeds)))
+        return (seeds + sampled)[:max(self.n_candidates, len(seeds))]
+
+    def _halving(self, executor: TrialExecutor, candidates: list):
+        # as many iterations as it takes to get down to one candidate, if the resource allows it
+        iterations = 1 + min(log_floor(len(candidates), self.factor),
+                             log_floor(self.max_resources // self.min_resources, self.factor))
+        for iteration in range(iterations):
+            resources = self.min_resources * self.factor ** iteration
+            ranked = self._evaluate(executor, [dict(params, **{self.resource: resources}) for params in candidates],
+                                    iteration)
+            candidates = [{name: value for name, value in params.items() if name != self.resource}
+                          for params, _ in ranked[:math.ceil(len(ranked) / self.factor)]]
+        return ranked[0]
+
+    def _record(self, params: dict, fold: int, result) -> None:
+        self.trial_store.add(self.data_digest_, params, fold, *result)
+
+    def _evaluate(self, executor: TrialExecutor, candidates: list, iteration: int) -> list:
+        """
+        Cross-validate every candidate on every fold; (params, mean score) pairs, best first
+        """
+        started = time.perf_counter()
+        trials = [(params, fold) for params in candidates for fold in range(self.n_splits_)]
+        results = [self.trial_store.get(self.data_digest_, params, fold) if self.trial_store is not None else None
+                   for params, fold in trials]
+        missing = [i for i, result in enumerate(results) if result is None]
+        self.n_resumed_ += len(trials) - len(missing)
+        fitted = executor.run(self.factory, [trials[i] for i in missing],
+                              cost=lambda params: params.get(self.resource, 1),
+                              done=self._record if self.trial_store is not None else None)
+        for i, result in zip(missing, fitted):
+            results[i] = result
+
+        ranked = []
+        for i, params in enumerate(candidates):
+            scores, fit_times = zip(*results[i * self.n_splits_:(i + 1) * self.n_splits_])
+            self.cv_results_['params'].append(params)
+            self.cv_results_['mean_test_score'].append(float(np.mean(scores)))
+            self.cv_results_['std_test_score'].append(float(np.std(scores)))
+            self.cv_results_['mean_fit_time'].append(float(np.mean(fit_times)))
+            self.cv_results_['iter'].append(iteration)
+            self.cv_results_['n_resources'].append(params.get(self.resource))
+            ranked.append((params, float(np.mean(scores))))
+        ranked.sort(key=lambda item: -item[1])
+
+        if self.verbose:
+            print('iteration {}: {} candidates x {} folds ({} resumed) in {:.1f} s on {} workers, '
+                  'best score {:.4f}'.format(iteration, len(candidates), self.n_splits_, len(trials) - len(missing),
+                                             time.perf_counter() - started, executor.workers, ranked[0][1]))
+        return ranked
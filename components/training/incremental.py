@@ -0,0 +1,175 @@
+"""
+Incremental retraining: update the production random forest with the training rows it has not seen.
+
+Every model artifact holds the hashes of the raw training rows it was fitted on (`train-rows.npy`).
+validate_data drops `post_date` and reshuffles the split on every run, so new rows are found by
+hash instead of by date. The update grows `INCREMENTAL_TREES` new trees with `warm_start` on the
+new rows plus a fraction `INCREMENTAL_REPLAY` of the earlier ones. It then drops the
+`INCREMENTAL_REPLACE` oldest trees, so the forest keeps its size when both are equal. The cost is
+that of fitting the new trees alone, a fraction of a full retrain.
+
+Rows are encoded with the encoders of the production bundle, so the old and the new trees see
+the same features. The updated model is only logged when its test MAE is at most
+`INCREMENTAL_TOLERANCE` (relative) above that of the production model. The MAE is measured on the
+test rows that neither model was trained on.
+"""
+import os
+import pickle
+import time
+
+import numpy as np
+import pandas as pd
+
+from decouple import config
+
+
+ROW_HASHES = 'train-rows.npy'
+
+
+def row_hashes(df: pd.DataFrame) -> np.ndarray:
+    """
+    64-bit hash of every raw row over all of its columns, independent of the column order
+    """
+    return pd.util.hash_pandas_object(df[sorted(df.columns)], index=False).to_numpy()
+
+
+def fill_values(df: pd.DataFrame) -> dict:
+    """
+    The values prepare_data fills missing wheel_drive and engine_capacity with, from the training rows `df`
+    """
+    return {'wheel_drive': df.wheel_drive.mode()[0], 'engine_capacity': float(int(df.engine_capacity.mean()))}
+
+
+def clean_rows(df: pd.DataFrame, fill: dict = None) -> pd.DataFrame:
+    """
+    The missing values and filters of prepare_data; the index of `df` is kept. Missing values are
+    filled with `fill` (see fill_values), from `df` itself by default.
+    """
+    from components.data_preparation import filter_category_feature, filter_numeric_feature, filter_outline_target
+
+    df = df.fillna(fill or fill_values(df))
+    return filter_category_feature(filter_numeric_feature(filter_outline_target(df)))
+
+
+def update_forest(model, X_new, y_new, X_old=None, y_old=None, trees: int = 50, replace: int = 50,
+                  replay: float = 1.0, random_state: int = None):
+    """
+    Grow `trees` trees on the new rows plus a fraction `replay` of the old ones, then drop the
+    `replace` oldest trees. `model` is updated in place and returned.
+    """
+    if replace >= len(model.estimators_) + trees:
+        raise ValueError('Cannot replace {} of {} trees'.format(replace, len(model.estimators_) + trees))
+    X, y = X_new, y_new
+    if X_old is not None and replay > 0 and len(X_old):
+        picks = np.arange(len(X_old))
+        if replay < 1:
+            picks = np.random.RandomState(random_state).choice(len(X_old), int(round(replay * len(X_old))),
+                                                               replace=False)
+        X, y = np.vstack([X_new, X_old[picks]]), np.concatenate([y_new, y_old[picks]])
+
+    # warm_start fits only the trees beyond the ones already in estimators_
+    model.set_params(warm_start=True, n_estimators=len(model.estimators_) + trees)
+    if random_state is not None:
+        model.set_params(random_state=random_state)
+    model.fit(X, y)
+    if replace:
+        model.estimators_ = model.estimators_[replace:]
+    model.set_params(warm_start=False, n_estimators=len(model.estimators_))
+    return model
+
+
+def load_dataset(run, name: str) -> pd.DataFrame:
+    artifact_data = run.use_artifact('{}:latest'.format(name)).get(name)
+    return pd.DataFrame(columns=artifact_data.columns, data=artifact_data.data)
+
+
+def train_incremental(project, base=None):
+    """
+    Update the model artifact `base` (INCREMENTAL_BASE, the production model by default) with the new
+    rows of the latest train-data, and log it as a new model version if it passes the evaluation gate
+    """
+    import wandb
+    from sklearn.metrics import mean_absolute_error, mean_squared_error, r2_score
+
+    from serving.bundle import read_bundle, save_bundle
+    from serving.drift import reference_statistics
+    from serving.forest import FlatForest
+
+    base = base or config('INCREMENTAL_BASE', default='model:product')
+    trees = config('INCREMENTAL_TREES', default=50, cast=int)
+    replace = config('INCREMENTAL_REPLACE', default=50, cast=int)
+    replay = config('INCREMENTAL_REPLAY', default=1.0, cast=float)
+    tolerance = config('INCREMENTAL_TOLERANCE', default=0.01, cast=float)
+
+    run = wandb.init(project=project, job_type='incremental-training')
+    base_dir = run.use_artifact(base).download()
+    if not os.path.exists(os.path.join(base_dir, ROW_HASHES)):
+        raise ValueError('{} has no {}; it was trained before incremental training existed, run a full '
+                         'retrain first'.format(base, ROW_HASHES))
+    with open(os.path.join(base_dir, 'model.pkl'), 'rb') as file:
+        model = pickle.load(file)
+    manifest, _, encoders = read_bundle(os.path.join(base_dir, 'bundle'), mmap=False)
+    if manifest['kind'] != 'random_forest':
+        raise ValueError('Incremental training updates random forests, {} is a {} model'.format(base, manifest['kind']))
+    seen = np.load(os.path.join(base_dir, ROW_HASHES))
+
+    df_raw = load_dataset(run, 'train-data')
+    hashes = pd.Series(row_hashes(df_raw), index=df_raw.index)
+    # the test rows are filled with the values of the training rows, as prepare_data does
+    fill = fill_values(df_raw)
+    df_train = clean_rows(df_raw, fill)
+    is_new = ~np.isin(hashes[df_train.index].to_numpy(), seen)
+    X_train, y_train = encoders.encode_frame(df_train), df_train['price'].to_numpy(dtype=np.float64)
+
+    # test rows the production model was trained on, after a reshuffled split, would flatter both models;
+    # they are matched on the raw rows, like the hashes in `seen`
+    df_test_raw = load_dataset(run, 'test-data')
+    test_hashes = pd.Series(row_hashes(df_test_raw), index=df_test_raw.index)
+    df_test = clean_rows(df_test_raw, fill)
+    df_test = df_test[~np.isin(test_hashes[df_test.index].to_numpy(), seen)]
+    X_test, y_test = encoders.encode_frame(df_test), df_test['price'].to_numpy(dtype=np.float64)
+    if not len(y_test):
+        raise ValueError('Every test row was used to train {}, there is nothing to evaluate on'.format(base))
+
+    wandb.config.update({'incremental-base': base, 'incremental-new-rows': int(is_new.sum()),
+                         'incremental-trees': trees, 'incremental-replace': replace, 'incremental-replay': replay,
+                         'test-rows': len(y_test)})
+    if not is_new.any():
+        print('No new training rows since {}'.format(base))
+        wandb.finish()
+        return
+
+    mae_base = mean_absolute_error(model.predict(X_test), y_test)
+    started = time.perf_counter()
+    update_forest(model, X_train[is_new], y_train[is_new], X_train[~is_new], y_train[~is_new], trees=trees,
+                  replace=replace, replay=replay)
+    fit_time = time.perf_counter() - started
+
+    y_preds = model.predict(X_test)
+    mae = mean_absolute_error(y_preds, y_test)
+    mse = mean_squared_error(y_preds, y_test)
+    r2 = r2_score(y_preds, y_test)
+    passed = mae <= mae_base * (1 + tolerance)
+    wandb.config.update({'incremental-fit-time': fit_time, 'mae-test-base': mae_base, 'mse-test': mse,
+                         'mae-test': mae, 'r2-test': r2, 'gate-passed': passed})
+    print('{} new rows in {:.1f} s: test MAE {:.3f} against {:.3f} for {}, {}'.format(
+        int(is_new.sum()), fit_time, mae, mae_base, base, 'passed' if passed else 'rejected'))
+    if not passed:
+        wandb.finish()
+        return
+
+    with open('model.pkl', 'wb') as file:
+        pickle.dump(model, file)
+    np.save(ROW_HASHES, np.union1d(seen, hashes.to_numpy()))
+    save_bundle('bundle', FlatForest.from_estimator(model), encoders,
+                metadata={'mse-test': mse, 'mae-test': mae, 'r2-test': r2, 'base': base,
+                          'base-content-hash': manifest['content_hash']},
+                reference=reference_statistics(df_train))
+
+    artifact = wandb.Artifact('model', type='Model')
+    artifact.add_file('model.pkl')
+    artifact.add_file(ROW_HASHES)
+    artifact.add_dir('bundle', name='bundle')
+    run.log_artifact(artifact)
+
+    wandb.finish()
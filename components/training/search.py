@@ -0,0 +1,97 @@
+"""
+Hyperparameter searches over the random forest.
+
+`random` is the original RandomizedSearchCV: 20 configurations, each fitted on all 5 folds with
+its sampled number of trees. `halving` is successive halving with the number of trees as the
+resource. Every configuration is first scored with `min_resources` trees, and only the best
+1/`factor` of them move on to the next round with `factor` times as many trees. Weak
+configurations are therefore dropped after a few cheap fits.
+
+Both run either on sklearn's own search classes (`backend='sklearn'`) or on the persistent
+process pool over memory-mapped folds of components.training.executor (`backend='pool'`).
+Only the pool records its trials in a trial store to resume from and warm-start with.
+"""
+import numpy as np
+
+
+n_estimators = [int(x) for x in np.linspace(start = 20, stop = 300, num = 10)]
+# Number of features to consider at every split
+max_features = ['auto', 'sqrt']
+# Maximum number of levels in tree
+max_depth = [int(x) for x in np.linspace(10, 110, num = 11)]
+max_depth.append(None)
+# Minimum number of samples required to split a node
+min_samples_split = [2, 5, 10]
+# Minimum number of samples required at each leaf node
+min_samples_leaf = [1, 2, 4]
+# Method of selecting samples for training each tree
+bootstrap = [True, False]
+# Create the random grid
+random_grid = {'n_estimators': n_estimators,
+               'max_features': max_features,
+               'max_depth': max_depth,
+               'min_samples_split': min_samples_split,
+               'min_samples_leaf': min_samples_leaf,
+               'bootstrap': bootstrap}
+
+SEARCHES = ('random', 'halving')
+BACKENDS = ('pool', 'sklearn')
+
+
+def random_forest(**params):
+    from sklearn.ensemble import RandomForestRegressor
+
+    return RandomForestRegressor(**params)
+
+
+def make_search(kind: str = 'halving', backend: str = 'pool', n_candidates: int = 20, cv: int = 5, factor: int = 3,
+                random_state: int = 42, n_jobs: int = -1, verbose: int = 2, trial_store=None, warm_start: int = 0):
+    """
+    An unfitted search over `random_grid`; `n_candidates` configurations are sampled in both modes.
+    `trial_store` is a components.training.trials.TrialStore to resume from, and `warm_start` the
+    number of its best configurations to seed the candidates with.
+    """
+    if kind not in SEARCHES:
+        raise ValueError('Unknown search {!r}, expected one of {}'.format(kind, SEARCHES))
+    if backend == 'pool':
+        from components.training.executor import PoolSearch
+
+        return PoolSearch(random_forest, random_grid if kind == 'random' else halving_grid(), kind=kind,
+                          n_candidates=n_candidates, cv=cv, resource='n_estimators', min_resources=min(n_estimators),
+                          max_resources=max(n_estimators), factor=factor, random_state=random_state, n_jobs=n_jobs,
+                          verbose=verbose, trial_store=trial_store, warm_start=warm_start)
+    if backend != 'sklearn':
+        raise ValueError('Unknown search backend {!r}, expected one of {}'.format(backend, BACKENDS))
+    if trial_store is not None or warm_start:
+        raise ValueError('Trial stores and warm starts need the pool backend')
+
+    from sklearn.ensemble import RandomForestRegressor
+
+    if kind == 'random':
+        from sklearn.model_selection import RandomizedSearchCV
+
+        return RandomizedSearchCV(estimator=RandomForestRegressor(), param_distributions=random_grid,
+                                  n_iter=n_candidates, cv=cv, verbose=verbose, random_state=random_state,
+                                  n_jobs=n_jobs)
+    if kind == 'halving':
+        from sklearn.experimental import enable_halving_search_cv  # noqa: F401
+        from sklearn.model_selection import HalvingRandomSearchCV
+
+        return HalvingRandomSearchCV(estimator=RandomForestRegressor(), param_distributions=halving_grid(),
+                                     n_candidates=n_candidates, resource='n_estimators', min_resources=min(n_estimators),
+                                     max_resources=max(n_estimators), factor=factor, cv=cv, verbose=verbose,
+                                     random_state=random_state, n_jobs=n_jobs)
+
+
+def halving_grid() -> dict:
+    """
+    The tree count is the resource of successive halving, so it is not sampled: 20, 60 then 180 trees
+    """
+    return {name: values for name, values in random_grid.items() if name != 'n_estimators'}
+
+
+def fit_seconds(search) -> float:
+    """
+    Total time spent fitting, summed over every configuration and fold the search tried
+    """
+    return float(np.sum(search.cv_results_['mean_fit_time']) * search.n_splits_)
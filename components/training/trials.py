@@ -0,0 +1,106 @@
+"""
+Append-only store of finished search trials, so an interrupted search resumes where it stopped.
+
+Every (configuration, fold) fit is written as one JSON line as soon as it completes. The line holds
+the digest of the training data and folds, the parameters, the fold, the test score and the fit
+time. A search on the same data looks each trial up before running it and only fits the missing
+ones. A line cut short by a crash is dropped when the store is opened. The best configurations of
+earlier searches can also seed the candidates of a new search (`best`).
+"""
+import hashlib
+import json
+import os
+import time
+from collections import defaultdict
+
+import numpy as np
+
+
+def data_digest(X, y, cv: int) -> str:
+    """
+    Digest of the training matrix, the target and the number of folds: a trial is only reused on identical folds
+    """
+    digest = hashlib.sha1()
+    for array in (X, y):
+        array = np.ascontiguousarray(array, dtype=np.float64)
+        digest.update(str(array.shape).encode())
+        digest.update(array.tobytes())
+    digest.update(str(cv).encode())
+    return digest.hexdigest()
+
+
+def params_key(params: dict) -> str:
+    return json.dumps(params, sort_keys=True, default=_json_default)
+
+
+def _json_default(value):
+    # numpy scalars drawn by ParameterSampler from numpy distributions
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError('{!r} is not JSON serializable'.format(value))
+
+
+class TrialStore:
+    """
+    Finished trials in a JSON lines file at `path`, indexed in memory by (data digest, parameters, fold)
+    """
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self.trials = {}
+        if os.path.exists(path):
+            with open(path, 'rb+') as file:
+                content = file.read()
+                # drop the partial last line of a store whose writer was killed mid-write
+                file.truncate(content.rfind(b'\n') + 1)
+            for line in content.decode('utf-8').splitlines():
+                try:
+                    trial = json.loads(line)
+                except ValueError:
+                    continue
+                self.trials[(trial['data'], params_key(trial['params']), trial['fold'])] = trial
+
+    def __len__(self) -> int:
+        return len(self.trials)
+
+    def get(self, data: str, params: dict, fold: int):
+        """
+        (score, fit time) of a finished trial, or None
+        """
+        trial = self.trials.get((data, params_key(params), fold))
+        return None if trial is None else (trial['score'], trial['fit_time'])
+
+    def add(self, data: str, params: dict, fold: int, score: float, fit_time: float) -> None:
+        trial = {'data': data, 'params': json.loads(params_key(params)), 'fold': fold, 'score': float(score),
+                 'fit_time': float(fit_time), 'time': time.time()}
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        # one write per line and a flush, so a crash loses at most the trial being written
+        with open(self.path, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(trial) + '\n')
+            file.flush()
+        self.trials[(data, params_key(params), fold)] = trial
+
+    def best(self, top: int, n_splits: int, names=None, data: str = None) -> list:
+        """
+        Parameters of the `top` configurations with the highest mean score over `n_splits` finished
+        folds. Only the parameters in `names` are kept, so configurations that differ elsewhere (the
+        tree count of a halving round, say) are ranked once, by their best score. `data` restricts
+        the ranking to trials on one training set; by default trials on any data count.
+        """
+        folds = defaultdict(dict)
+        for (digest, key, fold), trial in self.trials.items():
+            if data is None or digest == data:
+                folds[(digest, key)][fold] = trial['score']
+
+        scores = {}
+        for (_, key), fold_scores in folds.items():
+            if len(fold_scores) < n_splits:
+                continue
+            params = json.loads(key)
+            if names is not None:
+                params = {name: value for name, value in params.items() if name in names}
+            key = params_key(params)
+            scores[key] = max(scores.get(key, -np.inf), float(np.mean(list(fold_scores.values()))))
+        return [json.loads(key) for key in sorted(scores, key=lambda key: -scores[key])[:top]]
@@ -5,9 +5,6 @@
 import logging
 import sys
 from pathlib import Path
-from unicodedata import category
-from rich.logging import RichHandler
-import logging.config as lcfg
 # Directories
 BASE_DIR = Path(__file__).parent.parent.absolute()
 CONFIG_DIR = Path(BASE_DIR, "configs")
@@ -33,11 +30,13 @@ category_other = ['external_color','internal_color','origin', 'gearbox', 'wheel_
 
 
 # Create dirs
-LOGS_DIR.mkdir(parents=True, exist_ok=True)
-DATA_DIR.mkdir(parents=True, exist_ok=True)
-STORES_DIR.mkdir(parents=True, exist_ok=True)
-MODEL_REGISTRY.mkdir(parents=True, exist_ok=True)
-TRANSFORM_STORE.mkdir(parents=True, exist_ok=True)
+def create_dirs():
+    LOGS_DIR.mkdir(parents=True, exist_ok=True)
+    DATA_DIR.mkdir(parents=True, exist_ok=True)
+    STORES_DIR.mkdir(parents=True, exist_ok=True)
+    MODEL_REGISTRY.mkdir(parents=True, exist_ok=True)
+    TRANSFORM_STORE.mkdir(parents=True, exist_ok=True)
+
 
 # Logger
 logging_config = {
@@ -81,9 +80,20 @@ logging_config = {
         },
     },
 }
-lcfg.dictConfig(logging_config)
 logger = logging.getLogger("root")
-logger.handlers[0] = RichHandler(markup=True)
+
+
+def setup_logging():
+    """
+    Create the directories and install the console and rotating file handlers
+    """
+    import logging.config as lcfg
+    from rich.logging import RichHandler
+
+    create_dirs()
+    lcfg.dictConfig(logging_config)
+    logger.handlers[0] = RichHandler(markup=True)
+    return logger
 
 
 # config data
@@ -0,0 +1,21 @@
+# gunicorn.conf.py
+# Pre-fork serving: the model is loaded once in the master and shared with the workers.
+#
+#     gunicorn -c gunicorn.conf.py api:api
+
+import multiprocessing
+import os
+
+
+bind = '0.0.0.0:{}'.format(os.environ.get('PORT', '8080'))
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count()))
+worker_class = 'uvicorn.workers.UvicornWorker'
+
+# import api.py (and load the model + encoders) before forking; the workers then share
+# those pages copy-on-write and the memory-mapped forest arrays through the page cache
+preload_app = True
+timeout = 120
+
+# POST /api/admin/reload reaches a single worker: it touches this file instead, and the watcher
+# every worker runs reloads them all within RELOAD_WATCH_INTERVAL seconds
+os.environ.setdefault('RELOAD_WATCH_FILE', '/tmp/mlops-reload')
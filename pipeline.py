@@ -1,10 +1,32 @@
-from components.data_extraction import extract_data
-from components.data_validation import validate_data
-from components.data_preparation import prepare_data
-from components.training import train
-
-project = 'mlops'
-extract_data(project=project)
-validate_data(project=project)
-prepare_data(project=project)
-train(project=project)
\ No newline at end of file
+import argparse
+import importlib
+
+# stage name -> (module, function); a stage's dependencies are only imported when it runs
+STAGES = {
+    'extract': ('components.data_extraction', 'extract_data'),
+    'validate': ('components.data_validation', 'validate_data'),
+    'prepare': ('components.data_preparation', 'prepare_data'),
+    'train': ('components.training', 'train'),
+    # not part of the default run: updates the production model instead of training a new one
+    'incremental': ('components.training.incremental', 'train_incremental'),
+}
+DEFAULT_STAGES = ['extract', 'validate', 'prepare', 'train']
+
+
+def run_stage(stage, project):
+    module, function = STAGES[stage]
+    getattr(importlib.import_module(module), function)(project=project)
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser()
+    parser.add_argument('stages', nargs='*', metavar='stage',
+                        help='any of {}; {} in order by default'.format(', '.join(STAGES), ', '.join(DEFAULT_STAGES)))
+    parser.add_argument('--project', default='mlops')
+    args = parser.parse_args()
+    unknown = [stage for stage in args.stages if stage not in STAGES]
+    if unknown:
+        parser.error('unknown stages: {}'.format(', '.join(unknown)))
+
+    for stage in args.stages or DEFAULT_STAGES:
+        run_stage(stage, args.project)
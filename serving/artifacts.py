@@ -0,0 +1,92 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+from contextlib import contextmanager
+
+
+logger = logging.getLogger(__name__)
+
+
+@contextmanager
+def timed_phase(name: str, timings: dict = None):
+    """
+    Log how long a startup phase took and keep it in `timings`
+    """
+    start = time.perf_counter()
+    yield
+    elapsed = time.perf_counter() - start
+    if timings is not None:
+        timings[name] = elapsed
+    logger.info('%s took %.3f s', name, elapsed)
+
+
+class ArtifactCache:
+    """
+    Content-addressed local copy of wandb artifacts.
+
+    Every downloaded artifact lives in `<root>/<digest>/`, and `<root>/refs/<name>` records
+    the digest an artifact name (e.g. `model:product`) resolved to the last time wandb
+    was reachable, which is what offline mode loads.
+    """
+
+    def __init__(self, root) -> None:
+        self.root = os.path.expanduser(str(root))
+        self.refs = os.path.join(self.root, 'refs')
+
+    def directory(self, digest: str) -> str:
+        return os.path.join(self.root, digest)
+
+    def _ref_path(self, name: str) -> str:
+        return os.path.join(self.refs, name.replace('/', '__').replace(':', '@'))
+
+    def read_ref(self, name: str):
+        try:
+            with open(self._ref_path(name)) as file:
+                return file.read().strip() or None
+        except FileNotFoundError:
+            return None
+
+    def write_ref(self, name: str, digest: str) -> None:
+        os.makedirs(self.refs, exist_ok=True)
+        path = self._ref_path(name)
+        with open(path + '.tmp', 'w') as file:
+            file.write(digest)
+        os.replace(path + '.tmp', path)
+
+    def fetch(self, name: str, type: str = None, offline: bool = False, timings: dict = None):
+        """
+        Return (directory, digest) of the artifact, downloading it only if its digest is not cached yet
+        """
+        if offline:
+            digest = self.read_ref(name)
+            if digest is None or not os.path.isdir(self.directory(digest)):
+                raise RuntimeError('Artifact {} is not in the local cache {}, it cannot be loaded offline'
+                                   .format(name, self.root))
+            logger.info('Offline: using cached %s (%s)', name, digest)
+            return self.directory(digest), digest
+
+        with timed_phase('resolve {}'.format(name), timings):
+            import wandb
+            artifact = wandb.Api().artifact(name, type=type)
+            digest = artifact.digest
+
+        directory = self.directory(digest)
+        if os.path.isdir(directory):
+            logger.info('Cache hit for %s (%s)', name, digest)
+        else:
+            with timed_phase('download {}'.format(name), timings):
+                os.makedirs(self.root, exist_ok=True)
+                staging = tempfile.mkdtemp(prefix='.download-', dir=self.root)
+                try:
+                    artifact.download(root=staging)
+                    os.replace(staging, directory)
+                except OSError:
+                    # another process finished the same download first
+                    shutil.rmtree(staging, ignore_errors=True)
+                    if not os.path.isdir(directory):
+                        raise
+        self.write_ref(name, digest)
+
+        return directory, digest
@@ -0,0 +1,107 @@
+import logging
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+
+logger = logging.getLogger(__name__)
+
+
+class MicroBatcher:
+    """
+    Coalesce single predictions that arrive close together into one vectorized call.
+
+    A worker thread takes the first waiting request, keeps collecting until either
+    `max_batch_size` items are queued or `max_wait` seconds have passed since that first
+    request arrived, scores the whole batch with `predict_many` and resolves every
+    caller's future with its own result.
+    """
+
+    def __init__(self, predict_many, max_batch_size: int = 64, max_wait: float = 0.002) -> None:
+        self.predict_many = predict_many
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self.queue = queue.Queue()
+
+        self.lock = threading.Lock()
+        self.batches = 0
+        self.items = 0
+        self.max_batch_seen = 0
+        self.wait_total = 0.0
+        self.wait_max = 0.0
+
+        self.thread = None
+
+    def start(self) -> None:
+        """
+        Start the worker thread; called once per serving process, after any fork
+        """
+        self.thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+        self.thread.start()
+
+    def submit(self, item) -> Future:
+        future = Future()
+        self.queue.put((item, future, time.perf_counter()))
+        return future
+
+    def _collect(self) -> list:
+        """
+        The next batch, without the requests whose callers have already given up on them
+        """
+        batch = [self.queue.get()]
+        deadline = batch[0][2] + self.max_wait
+        while len(batch) < self.max_batch_size:
+            timeout = deadline - time.perf_counter()
+            try:
+                batch.append(self.queue.get(timeout=timeout) if timeout > 0 else self.queue.get_nowait())
+            except queue.Empty:
+                break
+        # asyncio.wrap_future cancels the future when the client disconnects or the request times out
+        return [entry for entry in batch if entry[1].set_running_or_notify_cancel()]
+
+    def _run(self) -> None:
+        while True:
+            # this is the only batcher thread: nothing raised by a batch may end it
+            try:
+                batch = self._collect()
+                if batch:
+                    self._score(batch)
+            except Exception:
+                logger.exception('Micro-batcher error')
+
+    def _score(self, batch) -> None:
+        started = time.perf_counter()
+        try:
+            results = self.predict_many([item for item, _, _ in batch])
+            if len(results) != len(batch):
+                raise ValueError('{} results for a batch of {} items'.format(len(results), len(batch)))
+        except Exception as error:
+            logger.exception('Micro-batch of %d items failed', len(batch))
+            for _, future, _ in batch:
+                future.set_exception(error)
+        else:
+            for (_, future, _), result in zip(batch, results):
+                future.set_result(result)
+        self._record(batch, started)
+
+    def _record(self, batch, started) -> None:
+        waits = [started - enqueued for _, _, enqueued in batch]
+        with self.lock:
+            self.batches += 1
+            self.items += len(batch)
+            self.max_batch_seen = max(self.max_batch_seen, len(batch))
+            self.wait_total += sum(waits)
+            self.wait_max = max(self.wait_max, max(waits))
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'batches': self.batches,
+                'items': self.items,
+                'mean_batch_size': self.items / self.batches if self.batches else 0.0,
+                'max_batch_size': self.max_batch_seen,
+                'mean_wait_ms': 1e3 * self.wait_total / self.items if self.items else 0.0,
+                'max_wait_ms': 1e3 * self.wait_max,
+            }
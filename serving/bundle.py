@@ -0,0 +1,158 @@
+"""
+Single versioned serving bundle: compiled encoder tables, flattened trees and feature order.
+
+    <bundle>/manifest.json    format, kind, feature order, encoder tables, drift reference, content hash
+    <bundle>/forest/*.npy     FlatForest arrays, memory-mapped read-only at load
+
+The served version is the start of the content hash, which leaves out the build time, metadata
+and drift reference: rebuilding the same model does not trigger a reload.
+
+`kind` is `random_forest` (averaged trees) or `gradient_boosting` (baseline plus summed trees).
+Both are served by the same FlatForest traversal. Build a bundle from a pickled model and the
+fitted encoders with
+
+    python -m serving.bundle model.pkl branch.pkl model-encoder.pkl others.pkl bundle/ --reference train.csv
+"""
+import argparse
+import hashlib
+import json
+import os
+import pickle
+import shutil
+import tempfile
+import time
+
+import pandas as pd
+
+from serving.drift import reference_statistics
+from serving.encoders import CompiledEncoders, FEATURES
+from serving.forest import FlatForest
+
+
+BUNDLE_FORMAT = 1
+MANIFEST = 'manifest.json'
+# model kind -> how FlatForest combines its trees
+KINDS = {'random_forest': 'mean', 'gradient_boosting': 'sum'}
+# the manifest entries that change predictions; build time, metrics and the drift reference do not
+HASHED = ('format', 'kind', 'features', 'encoders')
+
+
+def content_hash(manifest: dict, forest_dir: str) -> str:
+    """
+    SHA-256 over what the bundle predicts with: the HASHED manifest entries and the bytes of every
+    forest array. Rebuilding the same model therefore keeps its version.
+    """
+    digest = hashlib.sha256()
+    body = {key: manifest[key] for key in HASHED if key in manifest}
+    digest.update(json.dumps(body, sort_keys=True, ensure_ascii=False).encode('utf-8'))
+    for name in sorted(os.listdir(forest_dir)):
+        digest.update(name.encode('utf-8'))
+        with open(os.path.join(forest_dir, name), 'rb') as file:
+            for block in iter(lambda: file.read(1 << 20), b''):
+                digest.update(block)
+    return digest.hexdigest()
+
+
+def is_bundle(directory: str) -> bool:
+    return os.path.exists(os.path.join(directory, MANIFEST))
+
+
+def save_bundle(directory: str, forest: FlatForest, encoders: CompiledEncoders, kind: str = None,
+                metadata: dict = None, reference: dict = None) -> str:
+    """
+    Write the bundle and return its content hash; `kind` follows from the forest by default and
+    `reference` holds the drift statistics of the training data. The bundle is written to a staging
+    directory next to `directory` and then swapped in, so nothing of a bundle that was there before
+    is left behind.
+    """
+    kind = kind or next(kind for kind, aggregation in KINDS.items() if aggregation == forest.aggregation)
+    if KINDS.get(kind) != forest.aggregation:
+        raise ValueError('A {} bundle cannot hold a forest aggregated by {}'.format(kind, forest.aggregation))
+    if forest.delta is None:
+        forest.prepare_explanations()
+    directory = os.path.abspath(directory)
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.bundle-', dir=parent)
+    try:
+        os.chmod(staging, 0o755)
+        forest_dir = os.path.join(staging, 'forest')
+        forest.save_arrays(forest_dir)
+
+        manifest = {
+            'format': BUNDLE_FORMAT,
+            'kind': kind,
+            'features': FEATURES,
+            'encoders': {col: [table, default] for col, (table, default) in encoders.tables.items()},
+            'created_at': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'metadata': metadata or {},
+        }
+        if reference is not None:
+            manifest['reference'] = reference
+        manifest['content_hash'] = content_hash(manifest, forest_dir)
+        with open(os.path.join(staging, MANIFEST), 'w', encoding='utf-8') as file:
+            json.dump(manifest, file, ensure_ascii=False, indent=1)
+
+        # os.replace cannot overwrite a non-empty directory: move the old bundle aside first
+        previous = None
+        if os.path.exists(directory):
+            previous = tempfile.mkdtemp(prefix='.bundle-old-', dir=parent)
+            os.replace(directory, os.path.join(previous, 'bundle'))
+        os.replace(staging, directory)
+        if previous is not None:
+            shutil.rmtree(previous, ignore_errors=True)
+    except BaseException:
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    return manifest['content_hash']
+
+
+def read_bundle(directory: str, mmap: bool = True, verify: bool = False):
+    """
+    Return (manifest, forest, encoders) of a bundle; `verify` recomputes the content hash
+    """
+    with open(os.path.join(directory, MANIFEST), encoding='utf-8') as file:
+        manifest = json.load(file)
+    if manifest['format'] != BUNDLE_FORMAT:
+        raise ValueError('Unsupported bundle format {} in {}'.format(manifest['format'], directory))
+    if manifest['features'] != FEATURES:
+        raise ValueError('Bundle {} was built for features {}, serving expects {}'.format(
+            directory, manifest['features'], FEATURES))
+    if manifest['kind'] not in KINDS:
+        raise ValueError('Unsupported model kind {!r} in {}'.format(manifest['kind'], directory))
+
+    forest_dir = os.path.join(directory, 'forest')
+    if verify and content_hash(manifest, forest_dir) != manifest['content_hash']:
+        raise ValueError('Bundle {} does not match its content hash'.format(directory))
+
+    forest = FlatForest.load_arrays(forest_dir, mmap_mode='r' if mmap else None)
+    if forest.aggregation != KINDS[manifest['kind']]:
+        raise ValueError('Bundle {} of kind {} holds a forest aggregated by {}'.format(
+            directory, manifest['kind'], forest.aggregation))
+    if forest.delta is None:
+        forest.prepare_explanations()
+    encoders = CompiledEncoders({col: (table, default) for col, (table, default) in manifest['encoders'].items()})
+    return manifest, forest, encoders
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build a serving bundle from a pickled forest and fitted encoders')
+    parser.add_argument('model', help='pickled RandomForestRegressor or HistGradientBoostingRegressor')
+    parser.add_argument('branch', help='pickled JamesSteinEncoder of branch')
+    parser.add_argument('model_encoder', help='pickled JamesSteinEncoder of model')
+    parser.add_argument('others', help='pickled OrdinalEncoder of the other categorical features')
+    parser.add_argument('output', help='bundle directory to write')
+    parser.add_argument('--reference', default=None, help='CSV of the raw training rows, for drift statistics')
+    args = parser.parse_args()
+
+    fitted = []
+    for path in [args.model, args.branch, args.model_encoder, args.others]:
+        with open(path, 'rb') as file:
+            fitted.append(pickle.load(file))
+    model, encoders = fitted[0], CompiledEncoders.from_encoders(*fitted[1:])
+    reference = reference_statistics(pd.read_csv(args.reference)) if args.reference else None
+    print(save_bundle(args.output, FlatForest.from_estimator(model), encoders, reference=reference))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,93 @@
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from serving.encoders import FEATURES
+
+
+def input_key(item) -> str:
+    """
+    Canonical hash of the fields the model sees; fields it ignores (location, fuels) do not split entries
+    """
+    values = [getattr(item, feature) for feature in FEATURES]
+    return hashlib.sha1(json.dumps(values, ensure_ascii=False).encode('utf-8')).hexdigest()
+
+
+class PredictionCache:
+    """
+    Bounded LRU cache of predictions with an optional time to live.
+
+    Every lookup passes the version of the model and encoders that would serve it;
+    when that version changes the whole cache is dropped, so a stale price is never
+    returned after a model swap.
+    """
+
+    def __init__(self, max_size: int = 4096, ttl: float = 0) -> None:
+        self.max_size = max_size
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.version = None
+        self.lock = threading.Lock()
+
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    def _check_version(self, version) -> None:
+        if version != self.version:
+            if self.entries:
+                self.invalidations += 1
+            self.entries.clear()
+            self.version = version
+
+    def get(self, key, version):
+        with self.lock:
+            self._check_version(version)
+            entry = self.entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+
+            value, expires = entry
+            if expires and expires < time.monotonic():
+                del self.entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+
+            self.entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, version, value) -> None:
+        expires = time.monotonic() + self.ttl if self.ttl else 0
+        with self.lock:
+            self._check_version(version)
+            self.entries[key] = (value, expires)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_size:
+                self.entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self) -> None:
+        with self.lock:
+            self.entries.clear()
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self.entries),
+                'max_size': self.max_size,
+                'ttl': self.ttl,
+                'hits': self.hits,
+                'misses': self.misses,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
@@ -0,0 +1,158 @@
+import glob
+import logging
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import pandas as pd
+
+
+logger = logging.getLogger(__name__)
+
+
+class RequestCapture:
+    """
+    Record served inputs and their predicted prices without slowing the request down.
+
+    `record` only appends to an in-memory deque; appends and pops on a deque are atomic, so
+    the request path takes no lock. When the buffer already holds `buffer_size` records, new
+    ones are dropped and counted instead of waiting for room. A writer thread drains the
+    buffer every `flush_interval` seconds into columns and writes them out as a compressed
+    Parquet shard once `shard_rows` records are pending or the oldest one is `shard_seconds`
+    old. Only the newest `max_shards` shards are kept in `directory`.
+    """
+
+    def __init__(self, directory: str, sample_rate: float = 1.0, buffer_size: int = 10000, shard_rows: int = 50000,
+                 shard_seconds: float = 300.0, max_shards: int = 100, compression: str = 'zstd',
+                 flush_interval: float = 1.0) -> None:
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.buffer_size = buffer_size
+        self.shard_rows = shard_rows
+        self.shard_seconds = shard_seconds
+        self.max_shards = max_shards
+        self.compression = compression
+        self.flush_interval = flush_interval
+        self.buffer = deque()
+
+        # only the writer thread and the overload path take the lock
+        self.lock = threading.Lock()
+        self.dropped = 0
+        self.written = 0
+        self.shards = 0
+        self.errors = 0
+        self.pending = 0
+
+        self.thread = None
+        self.stopping = threading.Event()
+
+    def start(self) -> None:
+        """
+        Start the writer thread; called once per serving process, after any fork
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        self.stopping.clear()
+        self.thread = threading.Thread(target=self._run, name='request-capture', daemon=True)
+        self.thread.start()
+
+    def stop(self) -> None:
+        """
+        Stop the writer thread and write out whatever is still buffered
+        """
+        if self.thread is None:
+            return
+        self.stopping.set()
+        self.thread.join()
+        self.thread = None
+
+    def record(self, input, price: float, version: str) -> None:
+        if self.sample_rate < 1.0 and random.random() >= self.sample_rate:
+            return
+        # the length check and the append are not atomic together, so the buffer may overshoot by a few records
+        if len(self.buffer) >= self.buffer_size:
+            with self.lock:
+                self.dropped += 1
+            return
+        self.buffer.append((time.time(), input, price, version))
+
+    def record_many(self, inputs, prices, version: str) -> None:
+        for input, price in zip(inputs, prices):
+            self.record(input, price, version)
+
+    def _run(self) -> None:
+        columns, started = {}, None
+        while not self.stopping.wait(self.flush_interval):
+            started = self._drain(columns, started, self.shard_rows - self.pending)
+            if self.pending and (self.pending >= self.shard_rows or time.time() - started >= self.shard_seconds):
+                self._write(columns)
+                columns, started = {}, None
+        self._drain(columns, started, len(self.buffer))
+        if self.pending:
+            self._write(columns)
+
+    def _drain(self, columns: dict, started, room: int):
+        """
+        Move up to `room` buffered records into `columns`, returning when the oldest pending one was captured
+        """
+        moved = 0
+        while moved < room:
+            try:
+                timestamp, input, price, version = self.buffer.popleft()
+            except IndexError:
+                break
+            if started is None:
+                started = timestamp
+            row = input.dict()
+            row.update(timestamp=timestamp, price=price, version=version)
+            for name, value in row.items():
+                columns.setdefault(name, []).append(value)
+            moved += 1
+        with self.lock:
+            self.pending += moved
+        return started
+
+    def _write(self, columns: dict) -> None:
+        name = 'capture-{}-{}-{:05d}.parquet'.format(time.strftime('%Y%m%dT%H%M%S', time.gmtime()), os.getpid(),
+                                                     self.shards)
+        path = os.path.join(self.directory, name)
+        rows = self.pending
+        try:
+            frame = pd.DataFrame(columns)
+            frame['timestamp'] = pd.to_datetime(frame['timestamp'], unit='s')
+            frame.to_parquet(path + '.tmp', compression=self.compression, index=False)
+            os.replace(path + '.tmp', path)
+        except Exception:
+            logger.exception('Writing capture shard %s failed, %d records lost', path, rows)
+            with self.lock:
+                self.errors += 1
+                self.pending = 0
+            return
+
+        with self.lock:
+            self.written += rows
+            self.shards += 1
+            self.pending = 0
+        self._prune()
+
+    def _prune(self) -> None:
+        shards = sorted(glob.glob(os.path.join(self.directory, 'capture-*.parquet')), key=os.path.getmtime)
+        for path in shards[:max(len(shards) - self.max_shards, 0)]:
+            try:
+                os.remove(path)
+            except OSError:
+                # another worker process pruned it first
+                pass
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'buffered': len(self.buffer),
+                'pending': self.pending,
+                'written': self.written,
+                'dropped': self.dropped,
+                'shards': self.shards,
+                'errors': self.errors,
+                'sample_rate': self.sample_rate,
+            }
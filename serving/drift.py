@@ -0,0 +1,231 @@
+"""
+Streaming drift statistics of served inputs against the training data.
+
+Categorical features are counted per value and numeric features are counted into bins whose
+edges are quantiles of the training data, so memory depends on the reference alone and not on
+traffic. Every sketch can be merged with another one built on the same reference, for instance
+from another worker process.
+
+Reference statistics are stored in the serving bundle by training. For older artifacts, compute
+them from a CSV of the training rows and point DRIFT_REFERENCE at the output:
+
+    python -m serving.drift train.csv reference.json
+"""
+import argparse
+import json
+import math
+import threading
+from bisect import bisect_right
+
+import numpy as np
+import pandas as pd
+
+
+CATEGORY_FEATURES = ['branch', 'model', 'external_color', 'internal_color', 'car_type']
+NUMERIC_FEATURES = ['year', 'km_driven', 'engine_capacity']
+QUANTILES = (0.05, 0.25, 0.5, 0.75, 0.95)
+
+# bucket for unseen categories once `max_unseen` distinct ones are being counted
+OTHER = '<other>'
+
+
+def load_reference(path: str) -> dict:
+    with open(path, encoding='utf-8') as file:
+        return json.load(file)
+
+
+def reference_statistics(frame: pd.DataFrame, bins: int = 20) -> dict:
+    """
+    Category counts and quantile bins of the training rows, in the layout DriftMonitor expects
+    """
+    reference = {'rows': len(frame), 'categorical': {}, 'numeric': {}}
+    for feature in CATEGORY_FEATURES:
+        counts = frame[feature].dropna().astype(str).value_counts()
+        reference['categorical'][feature] = {value: int(count) for value, count in counts.items()}
+    for feature in NUMERIC_FEATURES:
+        values = frame[feature].dropna().to_numpy(dtype=np.float64)
+        edges = np.unique(np.quantile(values, np.linspace(0, 1, bins + 1))).tolist()
+        sketch = QuantileBins(edges)
+        for value in values.tolist():
+            sketch.add(value)
+        reference['numeric'][feature] = {'edges': edges, 'counts': sketch.counts,
+                                         'quantiles': dict(zip(map(str, QUANTILES),
+                                                               np.quantile(values, QUANTILES).tolist()))}
+    return reference
+
+
+class CategoryCounts:
+    """
+    Counts of the categories seen in training plus at most `max_unseen` new ones; any further
+    new category is counted under OTHER
+    """
+
+    def __init__(self, known, max_unseen: int = 32) -> None:
+        self.counts = dict.fromkeys(known, 0)
+        self.max_unseen = max_unseen
+        self.unseen = {}
+        self.total = 0
+
+    def add(self, value) -> None:
+        self.total += 1
+        if value in self.counts:
+            self.counts[value] += 1
+        elif value in self.unseen or len(self.unseen) < self.max_unseen:
+            self.unseen[value] = self.unseen.get(value, 0) + 1
+        else:
+            self.unseen[OTHER] = self.unseen.get(OTHER, 0) + 1
+
+    def merge(self, other: 'CategoryCounts') -> None:
+        self.total += other.total
+        for value, count in other.counts.items():
+            self.counts[value] = self.counts.get(value, 0) + count
+        for value, count in other.unseen.items():
+            if value in self.unseen or len(self.unseen) < self.max_unseen:
+                self.unseen[value] = self.unseen.get(value, 0) + count
+            else:
+                self.unseen[OTHER] = self.unseen.get(OTHER, 0) + count
+
+
+class QuantileBins:
+    """
+    Histogram over fixed bin edges: bin 0 holds values below edges[0], bin i values in
+    [edges[i - 1], edges[i]) and the last bin values from edges[-1] up. Quantiles are
+    interpolated within a bin, using the observed minimum and maximum for the open-ended ones.
+    """
+
+    def __init__(self, edges) -> None:
+        self.edges = list(edges)
+        self.counts = [0] * (len(self.edges) + 1)
+        self.total = 0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float) -> None:
+        self.counts[bisect_right(self.edges, value)] += 1
+        self.total += 1
+        if value < self.min:
+            self.min = value
+        if value > self.max:
+            self.max = value
+
+    def merge(self, other: 'QuantileBins') -> None:
+        if other.edges != self.edges:
+            raise ValueError('Cannot merge sketches with different bin edges')
+        self.counts = [a + b for a, b in zip(self.counts, other.counts)]
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+
+    def quantile(self, q: float) -> float:
+        if not self.total:
+            return math.nan
+        bounds = [self.min] + self.edges + [self.max]
+        rank, seen = q * self.total, 0
+        for i, count in enumerate(self.counts):
+            if count and seen + count >= rank:
+                low, high = max(bounds[i], self.min), min(bounds[i + 1], self.max)
+                return low + (high - low) * (rank - seen) / count
+            seen += count
+        return self.max
+
+
+def proportions(counts, total: int) -> np.ndarray:
+    return np.asarray(counts, dtype=np.float64) / max(total, 1)
+
+
+def population_stability(expected: np.ndarray, actual: np.ndarray, eps: float = 1e-4) -> float:
+    """
+    PSI between two distributions over the same buckets; above 0.2 is usually read as a real shift
+    """
+    expected, actual = np.maximum(expected, eps), np.maximum(actual, eps)
+    return float(np.sum((actual - expected) * np.log(actual / expected)))
+
+
+class DriftMonitor:
+    """
+    Per-feature sketches of served inputs, compared against reference statistics of the training data.
+
+    `observe` costs one dict update per categorical feature and one bisect over the bin edges per
+    numeric feature.
+    """
+
+    def __init__(self, reference: dict, max_unseen: int = 32) -> None:
+        self.reference = reference
+        self.lock = threading.Lock()
+        self.categorical = {feature: CategoryCounts(reference['categorical'][feature], max_unseen)
+                            for feature in CATEGORY_FEATURES}
+        self.numeric = {feature: QuantileBins(reference['numeric'][feature]['edges']) for feature in NUMERIC_FEATURES}
+        self.observed = 0
+
+    def observe(self, input) -> None:
+        with self.lock:
+            self.observed += 1
+            for feature, sketch in self.categorical.items():
+                sketch.add(getattr(input, feature))
+            for feature, sketch in self.numeric.items():
+                sketch.add(float(getattr(input, feature)))
+
+    def observe_many(self, inputs) -> None:
+        for input in inputs:
+            self.observe(input)
+
+    def merge(self, other: 'DriftMonitor') -> None:
+        with self.lock:
+            self.observed += other.observed
+            for feature, sketch in self.categorical.items():
+                sketch.merge(other.categorical[feature])
+            for feature, sketch in self.numeric.items():
+                sketch.merge(other.numeric[feature])
+
+    def report(self, threshold: float = 0.2, top: int = 10) -> dict:
+        """
+        Per feature: PSI and largest difference in proportions against the reference, and whether
+        the PSI exceeds `threshold`
+        """
+        with self.lock:
+            features = {}
+            for feature, sketch in self.categorical.items():
+                expected = self.reference['categorical'][feature]
+                values = list(expected) + list(sketch.unseen)
+                reference_p = proportions([expected.get(value, 0) for value in values], sum(expected.values()))
+                served = dict(sketch.counts, **sketch.unseen)
+                served_p = proportions([served[value] for value in values], sketch.total)
+                features[feature] = self._compare(reference_p, served_p, threshold, sketch.total)
+                features[feature].update({
+                    'unseen': sum(sketch.unseen.values()),
+                    'top': sorted(served.items(), key=lambda item: -item[1])[:top],
+                })
+            for feature, sketch in self.numeric.items():
+                expected = self.reference['numeric'][feature]
+                reference_p = proportions(expected['counts'], sum(expected['counts']))
+                served_p = proportions(sketch.counts, sketch.total)
+                features[feature] = self._compare(reference_p, served_p, threshold, sketch.total)
+                features[feature].update({
+                    'quantiles': {str(q): sketch.quantile(q) for q in QUANTILES} if sketch.total else {},
+                    'reference_quantiles': expected['quantiles'],
+                })
+            return {'observed': self.observed, 'reference_rows': self.reference['rows'], 'features': features}
+
+    @staticmethod
+    def _compare(reference_p: np.ndarray, served_p: np.ndarray, threshold: float, total: int) -> dict:
+        if not total:
+            return {'count': 0, 'psi': None, 'max_difference': None, 'drifted': False}
+        psi = population_stability(reference_p, served_p)
+        return {'count': total, 'psi': psi, 'max_difference': float(np.max(np.abs(served_p - reference_p))),
+                'drifted': psi > threshold}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute drift reference statistics from training rows')
+    parser.add_argument('data', help='CSV with the raw feature columns')
+    parser.add_argument('output', help='JSON file to write')
+    parser.add_argument('--bins', type=int, default=20, help='quantile bins per numeric feature')
+    args = parser.parse_args()
+
+    reference = reference_statistics(pd.read_csv(args.data), bins=args.bins)
+    with open(args.output, 'w', encoding='utf-8') as file:
+        json.dump(reference, file, ensure_ascii=False, indent=1)
+
+
+if __name__ == '__main__':
+    main()
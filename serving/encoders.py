@@ -0,0 +1,93 @@
+import hashlib
+import json
+
+import numpy as np
+import pandas as pd
+
+
+numeric_features = ['year', 'km_driven', 'num_seats', 'engine_capacity']
+category_features = ['branch', 'model', 'origin', 'external_color', 'internal_color', 'gearbox', 'wheel_drive',
+                     'car_type']
+FEATURES = numeric_features + category_features
+
+
+def ordinal_tables(encoder) -> dict:
+    """
+    Read the fitted category -> code tables out of a category_encoders OrdinalEncoder
+    """
+    tables = {}
+    for switch in encoder.mapping:
+        tables[switch['col']] = {key: int(code) for key, code in switch['mapping'].items() if not pd.isnull(key)}
+    return tables
+
+
+def unknown_code(encoder):
+    """
+    Code the OrdinalEncoder gives to categories it has not seen at fit time
+    """
+    return -1 if encoder.handle_unknown == 'value' else np.nan
+
+
+def compile_ordinal(encoder) -> dict:
+    default = unknown_code(encoder)
+    return {col: (table, default) for col, table in ordinal_tables(encoder).items()}
+
+
+def compile_james_stein(encoder) -> dict:
+    """
+    Fold the inner ordinal step and the smoothed target means into one category -> value table
+    """
+    default = unknown_code(encoder.ordinal_encoder)
+    compiled = {}
+    for col, table in ordinal_tables(encoder.ordinal_encoder).items():
+        scores = encoder.mapping[col]
+        values = {key: float(scores.get(code, np.nan)) for key, code in table.items()}
+        compiled[col] = (values, np.nan if pd.isnull(default) else float(scores.get(default, np.nan)))
+    return compiled
+
+
+class CompiledEncoders:
+    """
+    Plain dict lookup tables equivalent to the fitted branch/model/others encoders,
+    turning Input records straight into feature rows ordered as FEATURES
+    """
+
+    def __init__(self, tables: dict) -> None:
+        self.tables = tables
+        self.lookups = [tables[feature] for feature in category_features]
+
+    @classmethod
+    def from_encoders(cls, transform_branch, transform_model, transform_other):
+        tables = {}
+        tables.update(compile_james_stein(transform_branch))
+        tables.update(compile_james_stein(transform_model))
+        tables.update(compile_ordinal(transform_other))
+        return cls(tables)
+
+    @property
+    def digest(self) -> str:
+        """
+        Content hash of the lookup tables
+        """
+        content = json.dumps(self.tables, sort_keys=True, ensure_ascii=False)
+        return hashlib.sha1(content.encode('utf-8')).hexdigest()
+
+    def encode_row(self, item) -> list:
+        row = [item.year, item.km_driven, item.num_seats, item.engine_capacity]
+        for feature, (table, default) in zip(category_features, self.lookups):
+            row.append(table.get(getattr(item, feature), default))
+        return row
+
+    def encode(self, inputs) -> np.ndarray:
+        return np.array([self.encode_row(item) for item in inputs], dtype=np.float64).reshape(-1, len(FEATURES))
+
+    def encode_frame(self, df: pd.DataFrame) -> np.ndarray:
+        """
+        Same encoding for a DataFrame of raw records, column by column
+        """
+        X = np.empty((len(df), len(FEATURES)), dtype=np.float64)
+        for i, feature in enumerate(numeric_features):
+            X[:, i] = df[feature].to_numpy(dtype=np.float64)
+        for i, (feature, (table, default)) in enumerate(zip(category_features, self.lookups), len(numeric_features)):
+            X[:, i] = [table.get(value, default) for value in df[feature]]
+        return X
@@ -0,0 +1,299 @@
+import os
+
+import numpy as np
+
+
+TREE_LEAF = -1
+ARRAYS = ('feature', 'threshold', 'children', 'value', 'roots')
+# derived from the arrays above, see FlatForest.prepare_explanations
+EXPLAIN_ARRAYS = ('delta', 'parent_feature')
+# only written when set: the side missing values take, for models trained with them
+OPTIONAL_ARRAYS = ('missing_left',)
+SCALARS = ('max_depth', 'aggregation', 'baseline')
+# how the tree outputs make a prediction: the average of a bagged forest, or the baseline plus the sum for boosting
+AGGREGATIONS = ('mean', 'sum')
+
+# levels walked between two compactions of the (tree, row) pairs still moving
+STEPS_PER_COMPACTION = 4
+
+
+def round_down_float32(threshold: np.ndarray) -> np.ndarray:
+    """
+    Largest float32 not above each float64 threshold, so that for float32 inputs
+    `x <= threshold32` decides exactly like sklearn's `x <= threshold`
+    """
+    rounded = threshold.astype(np.float32)
+    over = rounded.astype(np.float64) > threshold
+    rounded[over] = np.nextafter(rounded[over], np.float32(-np.inf))
+    return rounded
+
+
+class FlatForest:
+    """
+    A tree ensemble flattened into contiguous node arrays.
+
+    All trees share the feature/threshold/children/value arrays and `roots` holds the
+    index of each tree's root. `children[node]` is (right, left), so the next node is
+    `children[node, x <= threshold]`. Leaves point to themselves on both sides. Every
+    row is walked through every tree at once, one vectorized step per tree level, and
+    pairs that reached a leaf are dropped every few levels.
+
+    A random forest predicts the mean of its trees, with float32 thresholds. A gradient
+    boosting model predicts `baseline` plus the sum of its trees, with float64 thresholds, and
+    sends missing values to the left of the nodes flagged in `missing_left`.
+    """
+
+    def __init__(self, feature, threshold, children, value, roots, max_depth, delta=None, parent_feature=None,
+                 aggregation='mean', baseline=0.0, missing_left=None) -> None:
+        self.feature = feature
+        self.threshold = threshold
+        self.children = children
+        self.value = value
+        self.roots = roots
+        self.max_depth = int(max_depth)
+        self.delta = delta
+        self.parent_feature = parent_feature
+        self.aggregation = str(aggregation)
+        if self.aggregation not in AGGREGATIONS:
+            raise ValueError('Unknown aggregation {!r}, expected one of {}'.format(self.aggregation, AGGREGATIONS))
+        self.baseline = float(baseline)
+        self.missing_left = missing_left
+
+    @property
+    def n_trees(self) -> int:
+        return len(self.roots)
+
+    @property
+    def n_nodes(self) -> int:
+        return len(self.feature)
+
+    @property
+    def left(self) -> np.ndarray:
+        return self.children[:, 1]
+
+    @property
+    def right(self) -> np.ndarray:
+        return self.children[:, 0]
+
+    @property
+    def is_leaf(self) -> np.ndarray:
+        return self.left == np.arange(self.n_nodes)
+
+    @classmethod
+    def from_estimator(cls, model):
+        """
+        Export a fitted RandomForestRegressor (or any bagged sklearn tree regressor), or a
+        HistGradientBoostingRegressor through `from_boosting`
+        """
+        if hasattr(model, '_predictors'):
+            return cls.from_boosting(model)
+        features, thresholds, children, values, roots = [], [], [], [], []
+        offset, max_depth = 0, 0
+        for estimator in model.estimators_:
+            tree = estimator.tree_
+            nodes = np.arange(tree.node_count) + offset
+            leaf = tree.children_left == TREE_LEAF
+
+            features.append(np.where(leaf, 0, tree.feature))
+            thresholds.append(np.where(leaf, np.inf, tree.threshold))
+            children.append(np.stack([np.where(leaf, nodes, tree.children_right + offset),
+                                      np.where(leaf, nodes, tree.children_left + offset)], axis=1))
+            values.append(tree.value[:, 0, 0])
+            roots.append(offset)
+
+            offset += tree.node_count
+            max_depth = max(max_depth, tree.max_depth)
+
+        return cls(feature=np.concatenate(features).astype(np.int32),
+                   threshold=round_down_float32(np.concatenate(thresholds)),
+                   children=np.concatenate(children).astype(np.int32),
+                   value=np.concatenate(values).astype(np.float64),
+                   roots=np.array(roots, dtype=np.int32),
+                   max_depth=max_depth)
+
+    @classmethod
+    def from_boosting(cls, model):
+        """
+        Export a fitted HistGradientBoostingRegressor with an identity link. Thresholds stay
+        float64, as sklearn compares them. sklearn only predicts with the leaf values, so the
+        value of every split node is recomputed as the sample-weighted mean of its children, for
+        `explain`.
+        """
+        if getattr(model, 'loss', None) not in ('least_squares', 'squared_error', 'least_absolute_deviation',
+                                                'absolute_error'):
+            raise ValueError('Cannot export a gradient boosting model with loss {!r}'.format(model.loss))
+        features, thresholds, children, values, missing, roots = [], [], [], [], [], []
+        offset, max_depth = 0, 0
+        for predictors in model._predictors:
+            nodes = predictors[0].nodes
+            if nodes['is_categorical'].any():
+                raise ValueError('Cannot export a gradient boosting model with categorical splits')
+            leaf = nodes['is_leaf'].astype(bool)
+            index = np.arange(len(nodes)) + offset
+            # renamed from threshold in sklearn 1.0
+            threshold = nodes['num_threshold'] if 'num_threshold' in nodes.dtype.names else nodes['threshold']
+
+            value = nodes['value'].astype(np.float64)
+            count = nodes['count'].astype(np.float64)
+            # children always come after their parent
+            for node in np.flatnonzero(~leaf)[::-1]:
+                left, right = nodes['left'][node], nodes['right'][node]
+                value[node] = (count[left] * value[left] + count[right] * value[right]) / (count[left] + count[right])
+
+            features.append(np.where(leaf, 0, nodes['feature_idx']))
+            thresholds.append(np.where(leaf, np.inf, threshold))
+            children.append(np.stack([np.where(leaf, index, nodes['right'].astype(np.int64) + offset),
+                                      np.where(leaf, index, nodes['left'].astype(np.int64) + offset)], axis=1))
+            values.append(value)
+            missing.append(~leaf & nodes['missing_go_to_left'].astype(bool))
+            roots.append(offset)
+
+            offset += len(nodes)
+            max_depth = max(max_depth, int(nodes['depth'].max()))
+
+        return cls(feature=np.concatenate(features).astype(np.int32),
+                   threshold=np.concatenate(thresholds).astype(np.float64),
+                   children=np.concatenate(children).astype(np.int32),
+                   value=np.concatenate(values),
+                   roots=np.array(roots, dtype=np.int32),
+                   max_depth=max_depth,
+                   aggregation='sum',
+                   baseline=float(np.ravel(model._baseline_prediction)[0]),
+                   missing_left=np.concatenate(missing))
+
+    def prepare_explanations(self) -> None:
+        """
+        Precompute, for every node, how much stepping into it from its parent changes the
+        value (`delta`) and which feature that parent split on (`parent_feature`), so that
+        per-feature contributions can be summed during a normal traversal
+        """
+        internal = ~self.is_leaf
+        parent = np.arange(self.n_nodes)
+        parent[self.left[internal]] = np.flatnonzero(internal)
+        parent[self.right[internal]] = np.flatnonzero(internal)
+
+        self.delta = self.value - self.value.take(parent)
+        self.parent_feature = self.feature.take(parent)
+
+    def save(self, path) -> None:
+        arrays = {name: getattr(self, name) for name in ARRAYS + OPTIONAL_ARRAYS + SCALARS
+                  if getattr(self, name) is not None}
+        np.savez(path, **arrays)
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as arrays:
+            return cls(**{name: arrays[name] for name in arrays.files})
+
+    def save_arrays(self, directory) -> None:
+        """
+        Write one .npy file per array so that `load_arrays` can memory-map them
+        """
+        os.makedirs(directory, exist_ok=True)
+        for name in ARRAYS + EXPLAIN_ARRAYS + OPTIONAL_ARRAYS:
+            path = os.path.join(directory, name + '.npy')
+            if getattr(self, name) is not None:
+                np.save(path, getattr(self, name))
+            elif os.path.exists(path):
+                # left by an earlier forest, load_arrays would pick it up
+                os.remove(path)
+        for name in SCALARS:
+            np.save(os.path.join(directory, name + '.npy'), np.array(getattr(self, name)))
+
+    @staticmethod
+    def has_arrays(directory) -> bool:
+        names = ARRAYS + ('max_depth',)
+        return all(os.path.exists(os.path.join(directory, name + '.npy')) for name in names)
+
+    @classmethod
+    def load_arrays(cls, directory, mmap_mode='r'):
+        """
+        Map the arrays read-only: processes loading the same files share one copy in the page cache
+        """
+        arrays = {name: np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode) for name in ARRAYS}
+        for name in EXPLAIN_ARRAYS + OPTIONAL_ARRAYS:
+            if os.path.exists(os.path.join(directory, name + '.npy')):
+                arrays[name] = np.load(os.path.join(directory, name + '.npy'), mmap_mode=mmap_mode)
+        # arrays written before boosting was supported have no aggregation or baseline
+        for name in SCALARS:
+            if os.path.exists(os.path.join(directory, name + '.npy')):
+                arrays[name] = np.load(os.path.join(directory, name + '.npy'))
+        return cls(**arrays)
+
+    def apply(self, X) -> np.ndarray:
+        """
+        Leaf index reached by every row in every tree, shape (n_rows, n_trees)
+        """
+        X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+        n_rows, n_features = X.shape
+        children = self.children.reshape(-1)
+        leaves = np.empty(self.n_trees * n_rows, dtype=self.children.dtype)
+
+        # pairs are grouped by tree so that consecutive lookups stay within one tree's nodes
+        position = np.arange(self.n_trees * n_rows)
+        offset = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, self.n_trees)
+        nodes = np.repeat(self.roots, n_rows)
+        while len(nodes):
+            for _ in range(STEPS_PER_COMPACTION):
+                previous = nodes
+                nodes = children.take(2 * nodes + self._go_left(X, offset, nodes))
+
+            done = nodes == previous
+            if done.any():
+                leaves[position[done]] = nodes[done]
+                active = ~done
+                position, offset, nodes = position[active], offset[active], nodes[active]
+        return leaves.reshape(self.n_trees, n_rows).T
+
+    def _go_left(self, X, offset, nodes) -> np.ndarray:
+        values = X.take(offset + self.feature.take(nodes))
+        go_left = values <= self.threshold.take(nodes)
+        if self.missing_left is not None:
+            go_left |= np.isnan(values) & self.missing_left.take(nodes)
+        return go_left
+
+    def predict(self, X) -> np.ndarray:
+        if self.aggregation == 'sum':
+            return self.baseline + self.value.take(self.apply(X)).sum(axis=1)
+        return self.value.take(self.apply(X)).mean(axis=1)
+
+    def predict_trees(self, X) -> np.ndarray:
+        """
+        Prediction of every tree for every row, shape (n_rows, n_trees), from the same single traversal
+        """
+        return self.value.take(self.apply(X))
+
+    def explain(self, X):
+        """
+        Split every prediction into a bias (the mean root value, or the baseline plus the sum of
+        the root values for boosting) plus one contribution per feature, summing the value change
+        of each split along the decision paths (treeinterpreter-style).
+        Returns (bias, contributions of shape (n_rows, n_features)); bias + contributions.sum(1)
+        equals predict(X).
+        """
+        if self.delta is None:
+            self.prepare_explanations()
+        X = np.ascontiguousarray(X, dtype=self.threshold.dtype)
+        n_rows, n_features = X.shape
+        children = self.children.reshape(-1)
+        contributions = np.zeros(n_rows * n_features)
+
+        offset = np.tile(np.arange(n_rows, dtype=np.int32) * n_features, self.n_trees)
+        nodes = np.repeat(self.roots, n_rows)
+        while len(nodes):
+            for _ in range(STEPS_PER_COMPACTION):
+                previous = nodes
+                nodes = children.take(2 * nodes + self._go_left(X, offset, nodes))
+                moved = nodes != previous
+                # offset + feature indexes the (row, feature) cell of `contributions`
+                contributions += np.bincount(offset + self.parent_feature.take(nodes),
+                                             weights=self.delta.take(nodes) * moved, minlength=len(contributions))
+
+            active = moved
+            offset, nodes = offset[active], nodes[active]
+
+        if self.aggregation == 'sum':
+            bias = np.full(n_rows, self.baseline + self.value.take(self.roots).sum())
+            return bias, contributions.reshape(n_rows, n_features)
+        bias = np.full(n_rows, self.value.take(self.roots).mean())
+        return bias, contributions.reshape(n_rows, n_features) / self.n_trees
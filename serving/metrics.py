@@ -0,0 +1,194 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+
+from serving import settings
+
+
+LATENCY_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+
+def format_labels(labels: dict) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join('{}="{}"'.format(key, str(value).replace('"', '\\"')) for key, value in labels.items()) + '}'
+
+
+class Counter:
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        self.values = {}
+        self.lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def render(self, base: dict = None) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} counter'.format(self.name)]
+        with self.lock:
+            for key, value in sorted(self.values.items()):
+                lines.append('{}{} {}'.format(self.name, format_labels(dict(base or {}, **dict(key))), value))
+        return lines
+
+
+class Histogram:
+    """
+    Cumulative-bucket histogram in the Prometheus exposition format
+    """
+
+    def __init__(self, name: str, help: str, buckets=LATENCY_BUCKETS) -> None:
+        self.name = name
+        self.help = help
+        self.buckets = tuple(buckets)
+        self.series = {}
+        self.lock = threading.Lock()
+
+    def observe(self, value: float, **labels) -> None:
+        key = tuple(sorted(labels.items()))
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(key)
+            if series is None:
+                series = self.series[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def render(self, base: dict = None) -> list:
+        lines = ['# HELP {} {}'.format(self.name, self.help), '# TYPE {} histogram'.format(self.name)]
+        with self.lock:
+            for key, (counts, total) in sorted(self.series.items()):
+                labels, cumulative = dict(base or {}, **dict(key)), 0
+                for bound, count in zip(self.buckets + ('+Inf',), counts):
+                    cumulative += count
+                    lines.append('{}_bucket{} {}'.format(self.name, format_labels(dict(labels, le=bound)), cumulative))
+                lines.append('{}_sum{} {}'.format(self.name, format_labels(labels), total))
+                lines.append('{}_count{} {}'.format(self.name, format_labels(labels), cumulative))
+        return lines
+
+
+class Metrics:
+    """
+    Request counters and latency histograms for the API, plus collectors that report
+    gauges owned by other components (cache, micro-batcher) at scrape time.
+
+    Every series is labelled with the `pid` of the worker process that holds it: under gunicorn each
+    worker counts on its own and a scrape reaches one of them, so series of different workers must
+    not be mistaken for one counter that went backwards.
+    """
+
+    def __init__(self, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.requests = Counter('mlops_requests_total', 'HTTP requests by endpoint and status code')
+        self.errors = Counter('mlops_request_errors_total', 'HTTP requests answered with a 5xx status or an exception')
+        self.latency = Histogram('mlops_request_latency_seconds', 'End-to-end HTTP request latency')
+        self.stages = Histogram('mlops_stage_latency_seconds', 'Latency of each stage of the prediction path')
+        self.collectors = []
+
+    @contextmanager
+    def _timer(self, stage: str):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stages.observe(time.perf_counter() - start, stage=stage)
+
+    def stage(self, stage: str):
+        """
+        Context manager timing one stage of the hot path, a no-op when metrics are disabled
+        """
+        if not self.enabled:
+            return NULL_TIMER
+        return self._timer(stage)
+
+    def observe_stage(self, stage: str, seconds: float) -> None:
+        if self.enabled:
+            self.stages.observe(seconds, stage=stage)
+
+    def add_collector(self, collect) -> None:
+        """
+        `collect()` returns (name, help, type, {labels tuple: value}) tuples rendered on every scrape
+        """
+        self.collectors.append(collect)
+
+    def render(self) -> str:
+        # read at scrape time: the metrics object is created in the gunicorn master, before the fork
+        base = {'pid': os.getpid()}
+        lines = (self.requests.render(base) + self.errors.render(base) + self.latency.render(base)
+                 + self.stages.render(base))
+        for collect in self.collectors:
+            for name, help, kind, values in collect():
+                lines.append('# HELP {} {}'.format(name, help))
+                lines.append('# TYPE {} {}'.format(name, kind))
+                for labels, value in values.items():
+                    lines.append('{}{} {}'.format(name, format_labels(dict(base, **dict(labels))), value))
+        return '\n'.join(lines) + '\n'
+
+
+def stats_collector(prefix: str, stats, counters=()):
+    """
+    Expose every numeric entry of a `stats()` dict as `<prefix>_<key>`, as counters for the keys in `counters`
+    """
+    def collect():
+        for key, value in stats().items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if key in counters:
+                yield '{}_{}_total'.format(prefix, key), key.replace('_', ' '), 'counter', {(): value}
+            else:
+                yield '{}_{}'.format(prefix, key), key.replace('_', ' '), 'gauge', {(): value}
+    return collect
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = _NullTimer()
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware counting requests and timing them end to end.
+
+    The request start time is left in `scope['mlops.start']` so handlers can time
+    what happened before they ran (body read and pydantic validation).
+    """
+
+    def __init__(self, app, metrics: Metrics, paths) -> None:
+        self.app = app
+        self.metrics = metrics
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or not self.metrics.enabled:
+            await self.app(scope, receive, send)
+            return
+
+        start = scope['mlops.start'] = time.perf_counter()
+        status = [500]
+
+        async def send_with_status(message):
+            if message['type'] == 'http.response.start':
+                status[0] = message['status']
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            endpoint = scope['path'] if scope['path'] in self.paths else 'other'
+            self.metrics.latency.observe(time.perf_counter() - start, endpoint=endpoint)
+            self.metrics.requests.inc(endpoint=endpoint, status=status[0])
+            if status[0] >= 500:
+                self.metrics.errors.inc(endpoint=endpoint)
+
+
+metrics = Metrics(enabled=settings.METRICS_ENABLED)
@@ -0,0 +1,262 @@
+import logging
+import os
+import pickle
+import shutil
+import threading
+import time
+from types import SimpleNamespace
+
+import numpy as np
+
+from serving.artifacts import ArtifactCache, timed_phase
+from serving.bundle import is_bundle, read_bundle
+from serving.encoders import CompiledEncoders, FEATURES
+from serving.forest import FlatForest
+from serving.metrics import metrics
+
+
+logger = logging.getLogger(__name__)
+
+
+class ModelBundle:
+    """
+    Everything needed to serve one model version: the flattened trees of a random forest or a
+    gradient boosting model, the compiled encoder tables and, when the bundle has them, drift
+    statistics of the training data
+    """
+
+    def __init__(self, version: str, forest: FlatForest, encoders: CompiledEncoders, timings: dict = None,
+                 reference: dict = None, kind: str = 'random_forest'):
+        self.version = version
+        self.kind = kind
+        self.forest = forest
+        self.encoders = encoders
+        self.timings = timings or {}
+        self.reference = reference
+        self.loaded_at = time.time()
+
+    @property
+    def has_intervals(self) -> bool:
+        """
+        Whether the trees are a bagged ensemble, whose spread gives prediction intervals; boosted trees are not
+        """
+        return self.forest.aggregation == 'mean'
+
+    def predict(self, inputs) -> np.ndarray:
+        """
+        Encode inputs through the compiled lookup tables and score every row in one pass over the flattened forest
+        """
+        with metrics.stage('encode'):
+            X = self.encoders.encode(inputs)
+        with metrics.stage('forest'):
+            return self.forest.predict(X)
+
+    def predict_interval(self, inputs, quantiles):
+        """
+        (prices, std, quantiles of shape (n_rows, len(quantiles))) over the per-tree predictions
+        """
+        with metrics.stage('encode'):
+            X = self.encoders.encode(inputs)
+        with metrics.stage('forest'):
+            trees = self.forest.predict_trees(X)
+        with metrics.stage('interval'):
+            return trees.mean(axis=1), trees.std(axis=1), np.quantile(trees, quantiles, axis=1).T
+
+    def explain(self, inputs):
+        """
+        (bias, per-feature contributions) of every input, see FlatForest.explain
+        """
+        with metrics.stage('encode'):
+            X = self.encoders.encode(inputs)
+        with metrics.stage('explain'):
+            return self.forest.explain(X)
+
+    def sweep(self, item, feature: str, values) -> np.ndarray:
+        """
+        Prices of `item` with one numeric feature set to each of `values`, from a single vectorized predict
+        """
+        with metrics.stage('encode'):
+            row = self.encoders.encode([item])
+        X = np.repeat(row, len(values), axis=0)
+        X[:, FEATURES.index(feature)] = values
+        with metrics.stage('forest'):
+            return self.forest.predict(X)
+
+    def sample_inputs(self, n: int = 8) -> list:
+        """
+        Synthetic inputs cycling through the known categories, used to warm up a freshly loaded bundle
+        """
+        samples = []
+        for i in range(n):
+            record = {col: list(table)[i % len(table)] if table else '' for col, (table, _) in
+                      self.encoders.tables.items()}
+            record.update(year=2015 + i % 8, km_driven=10000 * (i + 1), num_seats=5, engine_capacity=1.5)
+            samples.append(SimpleNamespace(**record))
+        return samples
+
+
+def load_pickle(path):
+    with open(path, 'rb') as file:
+        return pickle.load(file)
+
+
+def load_forest(artifact_dir: str, mmap: bool = True) -> FlatForest:
+    """
+    Flattened forest of an artifact, memory-mapped from `<artifact_dir>/forest/` when possible.
+
+    The .npy arrays, including the precomputed explanation deltas, are written the first
+    time an artifact is loaded, from the exported forest.npz or, for older artifacts, by
+    flattening model.pkl. Once they exist the sklearn model is never unpickled.
+    """
+    arrays_dir = os.path.join(artifact_dir, 'forest')
+    if mmap and FlatForest.has_arrays(arrays_dir):
+        forest = FlatForest.load_arrays(arrays_dir)
+        if forest.delta is not None:
+            return forest
+
+    forest_path = os.path.join(artifact_dir, 'forest.npz')
+    if os.path.exists(forest_path):
+        forest = FlatForest.load(forest_path)
+    else:
+        forest = FlatForest.from_estimator(load_pickle(os.path.join(artifact_dir, 'model.pkl')))
+    forest.prepare_explanations()
+    if not mmap:
+        return forest
+
+    staging = arrays_dir + '.{}.tmp'.format(os.getpid())
+    forest.save_arrays(staging)
+    if os.path.isdir(arrays_dir):
+        # written by an older layout or without the explanation arrays
+        shutil.rmtree(arrays_dir, ignore_errors=True)
+    try:
+        os.replace(staging, arrays_dir)
+    except OSError:
+        # another process wrote the arrays first
+        shutil.rmtree(staging, ignore_errors=True)
+    return FlatForest.load_arrays(arrays_dir)
+
+
+def load_bundle(artifact_name: str, cache_dir, stores_dir='stores', offline: bool = False,
+                mmap: bool = True) -> ModelBundle:
+    """
+    Fetch the model artifact through the local cache and load its serving bundle.
+
+    Artifacts logged before the bundle format existed only hold model.pkl (and maybe
+    forest.npz); those are served with the encoders pickled in `stores_dir`.
+    """
+    timings = {}
+    with timed_phase('load bundle', timings):
+        artifact_dir, artifact_digest = ArtifactCache(cache_dir).fetch(artifact_name, type='Model', offline=offline,
+                                                                       timings=timings)
+
+        bundle_dir = os.path.join(artifact_dir, 'bundle')
+        if is_bundle(bundle_dir):
+            with timed_phase('read bundle', timings):
+                manifest, forest, encoders = read_bundle(bundle_dir, mmap=mmap)
+            return ModelBundle(manifest['content_hash'][:12], forest, encoders, timings,
+                               reference=manifest.get('reference'), kind=manifest['kind'])
+
+        with timed_phase('load forest', timings):
+            forest = load_forest(artifact_dir, mmap=mmap)
+
+        with timed_phase('load encoders', timings):
+            encoders = CompiledEncoders.from_encoders(load_pickle(os.path.join(stores_dir, 'branch.pkl')),
+                                                      load_pickle(os.path.join(stores_dir, 'model.pkl')),
+                                                      load_pickle(os.path.join(stores_dir, 'others.pkl')))
+
+    version = '{}+{}'.format(artifact_digest[:12], encoders.digest[:12])
+    return ModelBundle(version, forest, encoders, timings)
+
+
+class ModelRegistry:
+    """
+    Holds the bundle currently being served and swaps in new versions without downtime.
+
+    Requests read `registry.current` once and keep using that bundle, so in-flight
+    requests finish on the version they started with. A reload loads and warms up the
+    new bundle on a background thread and only then replaces the reference.
+    """
+
+    def __init__(self, loader, warmup_size: int = 8) -> None:
+        self.loader = loader
+        self.warmup_size = warmup_size
+        self.current = None
+        self.lock = threading.Lock()
+        self.reloading = False
+        self.last_error = None
+
+    def load(self) -> ModelBundle:
+        bundle = self.loader()
+        self.warm_up(bundle)
+        self.current = bundle
+        logger.info('Serving model %s', bundle.version)
+        return bundle
+
+    def warm_up(self, bundle: ModelBundle) -> None:
+        with timed_phase('warm up {}'.format(bundle.version), bundle.timings):
+            prices = bundle.predict(bundle.sample_inputs(self.warmup_size))
+        if not np.all(np.isfinite(prices)):
+            raise ValueError('Model {} returned non-finite warm-up predictions'.format(bundle.version))
+
+    def reload(self) -> bool:
+        """
+        Start loading the latest bundle in the background; False if a reload is already running
+        """
+        with self.lock:
+            if self.reloading:
+                return False
+            self.reloading = True
+        threading.Thread(target=self._reload, name='model-reload', daemon=True).start()
+        return True
+
+    def _reload(self) -> None:
+        try:
+            bundle = self.loader()
+            if self.current is not None and bundle.version == self.current.version:
+                logger.info('Model %s is already being served', bundle.version)
+            else:
+                self.warm_up(bundle)
+                previous, self.current = self.current, bundle
+                logger.info('Swapped model %s for %s', previous.version if previous else None, bundle.version)
+            self.last_error = None
+        except Exception as error:
+            logger.exception('Model reload failed, still serving %s', self.current.version if self.current else None)
+            self.last_error = repr(error)
+        finally:
+            with self.lock:
+                self.reloading = False
+
+    def watch(self, path: str, interval: float = 5.0) -> None:
+        """
+        Reload whenever the modification time of `path` changes, e.g. after `touch path`
+        """
+        def poll():
+            seen = os.path.getmtime(path) if os.path.exists(path) else None
+            while True:
+                time.sleep(interval)
+                mtime = os.path.getmtime(path) if os.path.exists(path) else None
+                # a change seen while a reload is running is picked up once it has finished
+                if mtime != seen and self.reload():
+                    seen = mtime
+                    logger.info('%s changed, reloading model', path)
+
+        threading.Thread(target=poll, name='model-watch', daemon=True).start()
+
+    def status(self) -> dict:
+        bundle = self.current
+        return {
+            'version': bundle.version if bundle else None,
+            'kind': bundle.kind if bundle else None,
+            'loaded_at': bundle.loaded_at if bundle else None,
+            'timings': bundle.timings if bundle else {},
+            'reloading': self.reloading,
+            'last_error': self.last_error,
+        }
+
+
+def touch(path: str) -> None:
+    """
+    Update the modification time of `path`, so every registry watching it reloads
+    """
+    with open(path, 'a'):
+        os.utime(path, None)
@@ -0,0 +1,60 @@
+# serving/settings.py
+# Serving options, read from the environment or a .env file.
+
+from decouple import config
+
+
+# Micro-batching of concurrent /api/predict calls
+BATCHING = config('BATCHING', default=False, cast=bool)
+BATCH_MAX_SIZE = config('BATCH_MAX_SIZE', default=64, cast=int)
+BATCH_MAX_WAIT_MS = config('BATCH_MAX_WAIT_MS', default=2.0, cast=float)
+
+# LRU cache in front of /api/predict, 0 disables it; a TTL of 0 keeps entries until evicted
+CACHE_SIZE = config('CACHE_SIZE', default=4096, cast=int)
+CACHE_TTL = config('CACHE_TTL', default=0.0, cast=float)
+
+# Model artifact and its local content-addressed cache; OFFLINE never contacts wandb
+MODEL_ARTIFACT = config('MODEL_ARTIFACT', default='phamvanhanh6720/mlops/model:product')
+ARTIFACT_CACHE_DIR = config('ARTIFACT_CACHE_DIR', default='~/.cache/mlops/artifacts')
+OFFLINE = config('OFFLINE', default=False, cast=bool)
+
+# Memory-map the flattened forest arrays so that worker processes share one read-only copy
+FOREST_MMAP = config('FOREST_MMAP', default=True, cast=bool)
+
+# Hot model reload: POST /api/admin/reload (disabled unless ADMIN_TOKEN is set) or touching RELOAD_WATCH_FILE
+ADMIN_TOKEN = config('ADMIN_TOKEN', default='')
+RELOAD_WATCH_FILE = config('RELOAD_WATCH_FILE', default='')
+RELOAD_WATCH_INTERVAL = config('RELOAD_WATCH_INTERVAL', default=5.0, cast=float)
+
+# Stage timers, request counters and the Prometheus /metrics endpoint
+METRICS_ENABLED = config('METRICS_ENABLED', default=True, cast=bool)
+
+# NDJSON streaming endpoint: lines scored per chunk and the longest accepted line
+STREAM_CHUNK_SIZE = config('STREAM_CHUNK_SIZE', default=256, cast=int)
+STREAM_MAX_LINE_BYTES = config('STREAM_MAX_LINE_BYTES', default=65536, cast=int)
+
+# Largest number of points one /api/predict/sweep call may ask for
+SWEEP_MAX_POINTS = config('SWEEP_MAX_POINTS', default=1000, cast=int)
+
+# Capture of served inputs and prices into rotating Parquet shards; records are dropped, never waited for,
+# when the buffer is full
+CAPTURE = config('CAPTURE', default=False, cast=bool)
+CAPTURE_DIR = config('CAPTURE_DIR', default='capture')
+CAPTURE_SAMPLE_RATE = config('CAPTURE_SAMPLE_RATE', default=1.0, cast=float)
+CAPTURE_BUFFER_SIZE = config('CAPTURE_BUFFER_SIZE', default=10000, cast=int)
+CAPTURE_SHARD_ROWS = config('CAPTURE_SHARD_ROWS', default=50000, cast=int)
+CAPTURE_SHARD_SECONDS = config('CAPTURE_SHARD_SECONDS', default=300.0, cast=float)
+CAPTURE_MAX_SHARDS = config('CAPTURE_MAX_SHARDS', default=100, cast=int)
+CAPTURE_COMPRESSION = config('CAPTURE_COMPRESSION', default='zstd')
+
+# Drift sketches of served inputs, compared against the training statistics in the bundle or in DRIFT_REFERENCE
+DRIFT = config('DRIFT', default=True, cast=bool)
+DRIFT_REFERENCE = config('DRIFT_REFERENCE', default='')
+DRIFT_THRESHOLD = config('DRIFT_THRESHOLD', default=0.2, cast=float)
+DRIFT_MAX_UNSEEN = config('DRIFT_MAX_UNSEEN', default=32, cast=int)
+
+# Shadow evaluation: SHADOW_ARTIFACT scores SHADOW_FRACTION of the served rows on background threads
+SHADOW_ARTIFACT = config('SHADOW_ARTIFACT', default='')
+SHADOW_FRACTION = config('SHADOW_FRACTION', default=0.1, cast=float)
+SHADOW_WORKERS = config('SHADOW_WORKERS', default=1, cast=int)
+SHADOW_QUEUE_SIZE = config('SHADOW_QUEUE_SIZE', default=10000, cast=int)
@@ -0,0 +1,191 @@
+import logging
+import queue
+import random
+import threading
+import time
+from collections import deque
+
+import numpy as np
+
+
+logger = logging.getLogger(__name__)
+
+
+class Divergence:
+    """
+    Running statistics of candidate minus primary prices for one pair of model versions
+    """
+
+    def __init__(self, window: int) -> None:
+        self.count = 0
+        self.sum_diff = 0.0
+        self.sum_squared = 0.0
+        self.sum_abs = 0.0
+        self.sum_relative = 0.0
+        self.max_abs = 0.0
+        # absolute relative differences of the latest pairs, for percentiles
+        self.recent = deque(maxlen=window)
+
+    def add(self, primary: np.ndarray, candidate: np.ndarray) -> None:
+        diff = candidate - primary
+        relative = np.abs(diff) / np.maximum(np.abs(primary), 1e-9)
+        self.count += len(diff)
+        self.sum_diff += float(diff.sum())
+        self.sum_squared += float(np.square(diff).sum())
+        self.sum_abs += float(np.abs(diff).sum())
+        self.sum_relative += float(relative.sum())
+        self.max_abs = max(self.max_abs, float(np.abs(diff).max()))
+        self.recent.extend(relative.tolist())
+
+    def summary(self) -> dict:
+        if not self.count:
+            return {'count': 0}
+        percentiles = np.percentile(list(self.recent), [50, 90, 99]).tolist()
+        return {
+            'count': self.count,
+            'mean_diff': self.sum_diff / self.count,
+            'mean_abs_diff': self.sum_abs / self.count,
+            'rmse': (self.sum_squared / self.count) ** 0.5,
+            'max_abs_diff': self.max_abs,
+            'mean_relative_diff': self.sum_relative / self.count,
+            'relative_diff_percentiles': dict(zip(['p50', 'p90', 'p99'], percentiles)),
+        }
+
+
+class ShadowEvaluator:
+    """
+    Score a sample of served inputs with a candidate model, off the request path.
+
+    `submit` keeps a `fraction` of the served rows and puts them on a bounded queue without
+    waiting; when the queue is full the rows are dropped and counted. `workers` threads wait
+    `linger` seconds after the first queued row, take up to `max_batch_size` rows, score them
+    in one vectorized call with the bundle currently held by `registry` and record the paired
+    prices. Scoring in larger, less frequent batches keeps the CPU the workers take from
+    request handling low. Divergence is kept per (primary version, candidate version) pair, so
+    reloading either model starts a new series.
+    """
+
+    def __init__(self, registry, fraction: float = 0.1, workers: int = 1, queue_size: int = 10000,
+                 max_batch_size: int = 1024, linger: float = 0.25, window: int = 10000, keep_pairs: int = 100) -> None:
+        self.registry = registry
+        self.fraction = fraction
+        self.workers = workers
+        self.max_batch_size = max_batch_size
+        self.linger = linger
+        self.window = window
+        self.queue = queue.Queue(maxsize=queue_size)
+
+        self.lock = threading.Lock()
+        self.submitted = 0
+        self.dropped = 0
+        self.scored = 0
+        self.errors = 0
+        self.divergence = {}
+        self.pairs = deque(maxlen=keep_pairs)
+
+        self.threads = []
+
+    def start(self) -> None:
+        """
+        Start the worker threads; called once per serving process, after any fork
+        """
+        self.threads = [threading.Thread(target=self._run, name='shadow-{}'.format(i), daemon=True)
+                        for i in range(self.workers)]
+        for thread in self.threads:
+            thread.start()
+
+    def stop(self) -> None:
+        for _ in self.threads:
+            self.queue.put(None)
+        for thread in self.threads:
+            thread.join()
+        self.threads = []
+
+    def submit(self, inputs, prices, version: str) -> None:
+        submitted = dropped = 0
+        for input, price in zip(inputs, prices):
+            if self.fraction < 1.0 and random.random() >= self.fraction:
+                continue
+            try:
+                self.queue.put_nowait((input, price, version))
+                submitted += 1
+            except queue.Full:
+                dropped += 1
+        if submitted or dropped:
+            with self.lock:
+                self.submitted += submitted
+                self.dropped += dropped
+
+    def _collect(self) -> list:
+        batch = [self.queue.get()]
+        # sleep rather than wait on the queue, so that requests putting rows do not wake this thread every time
+        if batch[0] is not None:
+            time.sleep(self.linger)
+        while batch[-1] is not None and len(batch) < self.max_batch_size:
+            try:
+                batch.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self) -> None:
+        while True:
+            batch = self._collect()
+            stopping = batch[-1] is None
+            if stopping:
+                batch.pop()
+            if batch:
+                self._score(batch)
+            if stopping:
+                return
+
+    def _score(self, batch) -> None:
+        bundle = self.registry.current
+        inputs = [input for input, _, _ in batch]
+        try:
+            # straight through the encoders and the forest, leaving the served model's stage timers alone
+            candidate = bundle.forest.predict(bundle.encoders.encode(inputs))
+        except Exception:
+            logger.exception('Shadow scoring of %d rows with %s failed', len(batch), bundle.version)
+            with self.lock:
+                self.errors += len(batch)
+            return
+
+        primary = np.array([price for _, price, _ in batch], dtype=np.float64)
+        versions = [version for _, _, version in batch]
+        now = time.time()
+        with self.lock:
+            self.scored += len(batch)
+            for version in set(versions):
+                rows = [i for i, v in enumerate(versions) if v == version]
+                key = (version, bundle.version)
+                if key not in self.divergence:
+                    self.divergence[key] = Divergence(self.window)
+                self.divergence[key].add(primary[rows], candidate[rows])
+            kept = self.pairs.maxlen
+            for (input, price, version), shadow_price in zip(batch[-kept:], candidate[-kept:].tolist()):
+                self.pairs.append({'time': now, 'input': input.dict(), 'primary': price, 'primary_version': version,
+                                   'candidate': shadow_price, 'candidate_version': bundle.version})
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                'queue_depth': self.queue.qsize(),
+                'submitted': self.submitted,
+                'dropped': self.dropped,
+                'scored': self.scored,
+                'errors': self.errors,
+                'fraction': self.fraction,
+            }
+
+    def report(self, pairs: int = 0) -> dict:
+        """
+        Counters, divergence per (primary, candidate) version pair and the latest `pairs` paired predictions
+        """
+        report = dict(self.stats(), candidate_version=self.registry.current.version)
+        with self.lock:
+            report['divergence'] = [dict(divergence.summary(), primary_version=primary, candidate_version=candidate)
+                                    for (primary, candidate), divergence in self.divergence.items()]
+            if pairs:
+                report['pairs'] = list(self.pairs)[-pairs:]
+        return report
@@ -0,0 +1,78 @@
+import json
+
+from starlette.responses import StreamingResponse
+
+
+async def iter_lines(chunks, max_line_bytes: int):
+    """
+    Split an async stream of byte chunks into (line number, line) pairs without holding more than one line.
+    Lines longer than `max_line_bytes` are dropped and yielded as None so the caller can report them.
+    """
+    buffer, line_no, overflow = b'', 0, False
+    async for chunk in chunks:
+        buffer += chunk
+        while True:
+            end = buffer.find(b'\n')
+            if end < 0:
+                break
+            line, buffer = buffer[:end], buffer[end + 1:]
+            line_no += 1
+            yield line_no, None if overflow or len(line) > max_line_bytes else line
+            overflow = False
+        if len(buffer) > max_line_bytes:
+            buffer, overflow = b'', True
+    if buffer or overflow:
+        yield line_no + 1, None if overflow or len(buffer) > max_line_bytes else buffer
+
+
+async def score_ndjson(chunks, parse, score, chunk_size: int = 256, max_line_bytes: int = 65536):
+    """
+    Score an NDJSON body `chunk_size` lines at a time, yielding one NDJSON block of results per chunk.
+
+    `parse(line)` turns a line into an input or raises ValueError with a message for that
+    line; `score(inputs)` is awaited once per chunk and returns (prices, version). Results keep
+    the input order, and blank lines are skipped.
+    """
+    entries = []
+    async for line_no, line in iter_lines(chunks, max_line_bytes):
+        if line is None:
+            entries.append((line_no, None, 'line is longer than {} bytes'.format(max_line_bytes)))
+        elif line.strip():
+            try:
+                entries.append((line_no, parse(line), None))
+            except ValueError as error:
+                entries.append((line_no, None, str(error)))
+
+        if len(entries) >= chunk_size:
+            yield await _score_chunk(entries, score)
+            entries = []
+    if entries:
+        yield await _score_chunk(entries, score)
+
+
+async def _score_chunk(entries, score) -> bytes:
+    inputs = [item for _, item, _ in entries if item is not None]
+    prices, version = await score(inputs) if inputs else ([], None)
+
+    lines, prices = [], iter(prices)
+    for line_no, item, error in entries:
+        if item is None:
+            lines.append(json.dumps({'line': line_no, 'error': error}, ensure_ascii=False))
+        else:
+            lines.append(json.dumps({'line': line_no, 'price': float(next(prices)), 'version': version}))
+    return ('\n'.join(lines) + '\n').encode('utf-8')
+
+
+class BodyStreamingResponse(StreamingResponse):
+    """
+    Streaming response whose content is produced while the request body is still being read.
+
+    StreamingResponse normally races the content against a task that reads `receive`
+    to detect disconnects, which would steal body chunks from `request.stream()`;
+    here the content generator is the only reader.
+    """
+
+    async def __call__(self, scope, receive, send) -> None:
+        await self.stream_response(send)
+        if self.background is not None:
+            await self.background()